@@ -0,0 +1,104 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+# cosine similarity of query embeddings to reuse an answer for a paraphrased question (Vector and Hybrid search,
+# text search matches identical questions only), >= 1 disables it
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_query(query):
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def unit_vector(vector):
+    if vector is None:
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of get_answer() results with TTL.
+
+    Entries are grouped by key (position, model, response_length, search_type), within a key
+    a query matches either by normalized text or by query embedding similarity >= threshold.
+
+    Attributes:
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not found in the cache.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        # (key, normalized query) -> (created, query vector, answer data)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def semantic(self):
+        return self.similarity < 1
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl
+
+    def _find_similar(self, key, vector):
+        best_id, best_score = None, self.similarity
+        for entry_id, (created, entry_vector, _) in self.entries.items():
+            if entry_id[0] != key or entry_vector is None or self._expired(created):
+                continue
+            score = float(np.dot(entry_vector, vector))
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+        return best_id
+
+    def get(self, key, query, vector=None):
+        vector = unit_vector(vector)
+        entry_id = (key, normalize_query(query))
+        with self.lock:
+            entry = self.entries.get(entry_id)
+            if entry is not None and self._expired(entry[0]):
+                del self.entries[entry_id]
+                entry = None
+            if entry is None and self.semantic and vector is not None:
+                entry_id = self._find_similar(key, vector)
+                entry = self.entries.get(entry_id) if entry_id else None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            return dict(entry[2])
+
+    def put(self, key, query, answer_data, vector=None):
+        vector = unit_vector(vector)
+        with self.lock:
+            entry_id = (key, normalize_query(query))
+            self.entries[entry_id] = (time.time(), vector, dict(answer_data))
+            self.entries.move_to_end(entry_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self.entries),
+        }
@@ -2,13 +2,15 @@ import streamlit as st
 import time
 import uuid
 
-from app_rag import get_answer
+import metrics
+from app_rag import get_answer, get_answer_stream, prewarm
 from db import (
     save_conversation,
     save_feedback,
     get_recent_conversations,
     get_feedback_stats,
 )
+from evaluation_worker import submit_evaluation
 
 
 def print_log(message):
@@ -29,6 +31,9 @@ def main():
         },
     )
     st.title("✨ Interview Preparation Assistant")
+    # once per process, in a background thread
+    prewarm()
+    metrics.start_server()
 
     # Session state initialization
     if "conversation_id" not in st.session_state:
@@ -63,7 +68,7 @@ def main():
     print_log(f"User selected model: {model_choice}")
 
     # Search type selection
-    search_type = col2.radio("Select search type:", ["Text", "Vector"], horizontal=True)
+    search_type = col2.radio("Select search type:", ["Text", "Vector", "Hybrid"], horizontal=True)
     print_log(f"User selected search type: {search_type}")
 
     # Response length selection
@@ -72,6 +77,7 @@ def main():
 
     # User input
     user_input = st.text_input("Enter your question:", "What is Data Engineering?")
+    stream_answer = st.checkbox("Stream the answer", value=True)
 
     if st.button("🪄 Find the answer"):
         print_log(f"User asked: '{user_input}'")
@@ -84,13 +90,31 @@ def main():
 
             print_log(f"Getting answer from assistant using {model_choice} model and {search_type} search")
             start_time = time.time()
-            answer_data = get_answer(user_input, position_choice, model_choice, search_type, response_length)
-            print_log(f"Answer received in {time.time() - start_time:.2f} seconds")
-            st.success("Completed!")
-            st.write(answer_data["answer"])
+            if stream_answer:
+                answer_data = {}
+                st.write_stream(
+                    get_answer_stream(user_input, position_choice, model_choice, search_type, response_length, answer_data)
+                )
+                print_log(f"Answer received in {time.time() - start_time:.2f} seconds")
+                st.success("Completed!")
+            else:
+                answer_data = get_answer(user_input, position_choice, model_choice, search_type, response_length)
+                print_log(f"Answer received in {time.time() - start_time:.2f} seconds")
+                st.success("Completed!")
+                st.write(answer_data["answer"])
 
             # Display monitoring information
+            st.write(f"Time to first token: {answer_data['first_token_time']:.2f} seconds")
             st.write(f"Response time: {answer_data['response_time']:.2f} seconds")
+            if answer_data.get("cache_hit"):
+                st.write("Answer served from cache")
+            if answer_data.get("coalesced"):
+                st.write("Answer shared with an identical question asked at the same time")
+            if answer_data.get("rerank_time"):
+                st.write(f"Reranking time: {answer_data['rerank_time']:.2f} seconds")
+            st.write("Stage timings: " + ", ".join(
+                f"{stage} {seconds:.2f}s" for stage, seconds in answer_data["timings"].items()
+            ))
             st.write(f"Relevance: {answer_data['relevance']}")
             st.write(f"Model used: {answer_data['model_used']}")
             st.write(f"Total tokens: {answer_data['total_tokens']}")
@@ -106,6 +130,9 @@ def main():
                 position_choice,
             )
             print_log("Conversation saved successfully")
+            if answer_data["relevance"] == "PENDING":
+                submit_evaluation(st.session_state.conversation_id, user_input, answer_data["answer"])
+                print_log("Relevance evaluation queued")
 
     # Feedback buttons
     # col1, col2 = st.columns(2)
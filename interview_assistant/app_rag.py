@@ -1,37 +1,147 @@
 import os
 import time
 import json
-
-from openai import OpenAI
-
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# openai, elasticsearch and sentence_transformers are imported on first use, see get_singleton()
+import llm_backends
+import metrics
+from embedding_cache import encode_cached
+from answer_cache import ANSWER_CACHE, AnswerCache, normalize_query
+from single_flight import SingleFlight, FlightAbandoned
+from reranker import RERANK_ENABLED, RERANK_CANDIDATES, get_reranker
+from context_packing import (
+    CONTEXT_PACKING,
+    completion_token_budget,
+    context_token_budget,
+    count_tokens,
+    pack_context,
+)
 
 
 ELASTIC_URL = os.getenv("ELASTIC_URL", "http://elasticsearch:9200")
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434/v1/")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-api-key-here")
 INDEX_MODEL_NAME = os.getenv("INDEX_MODEL_NAME", "multi-qa-MiniLM-L6-cos-v1")
 INDEX_NAME = os.getenv("INDEX_NAME")
-SEARCH_RESULTS_NUM = 3 # 5
+# documents in the prompt (k of kNN search)
+SEARCH_RESULTS_NUM = int(os.getenv("SEARCH_RESULTS_NUM", "3"))
+# HNSW candidates per shard for kNN search, recall vs ES CPU per query (see tune_knn.py)
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "100"))
+# document fields returned by ES, vectors and hashes are never needed for prompts
+SEARCH_SOURCE_FIELDS = os.getenv("SEARCH_SOURCE_FIELDS", "text,section,question,position,id").split(",")
+# elasticsearch, or minsearch for in-process text/vector search without an ES cluster
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "elasticsearch")
+MINSEARCH_BOOST = {"question": 3.0, "section": 0.5}
+# Hybrid search: results of text and vector search each, fused with reciprocal rank fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
 
-es_client = Elasticsearch(ELASTIC_URL)
-ollama_client = OpenAI(base_url=OLLAMA_URL, api_key="ollama")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
 MODEL_NAME = os.getenv("MODEL_NAME") # "ollama/phi3.5" # openai/gpt-4o-mini
+# load the embedding model and connect clients in a background thread when the app starts
+PREWARM = os.getenv("PREWARM", "1") == "1"
 
+DEBUG = True
 
-index_model = SentenceTransformer(INDEX_MODEL_NAME)
+# concurrent identical questions wait for one answer instead of generating their own
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
 
-DEBUG = True
+# relevance evaluation runs in evaluation_worker after the conversation is saved
+EVAL_ASYNC = os.getenv("EVAL_ASYNC", "1") == "1"
+# share of answers evaluated at all, lower it under load
+EVAL_SAMPLE_RATE = float(os.getenv("EVAL_SAMPLE_RATE", "1.0"))
 
 def print_log(message):
     print(message, flush=True)
 
 
-def elastic_search_text(query, position, index_name=INDEX_NAME):
+@contextmanager
+def timed(timings, stage):
+    # adds seconds spent in the block to timings[stage], stages that didn't run stay absent (NULL in the DB)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start_time
+
+
+# clients, models and indices are created on first use, once per process (Streamlit reruns share them)
+_singletons = {}
+_singleton_locks = {}
+_singletons_lock = threading.Lock()
+
+
+def get_singleton(name, factory):
+    if name in _singletons:
+        return _singletons[name]
+    with _singletons_lock:
+        lock = _singleton_locks.setdefault(name, threading.Lock())
+    # one lock per name, loading the model doesn't block the ES client
+    with lock:
+        if name not in _singletons:
+            start_time = time.time()
+            _singletons[name] = factory()
+            print_log(f'Initialized {name} in {time.time() - start_time:.2f}s')
+    return _singletons[name]
+
+
+def create_es_client():
+    from elasticsearch import Elasticsearch
+    return Elasticsearch(ELASTIC_URL)
+
+
+def create_index_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(INDEX_MODEL_NAME)
+
+
+def get_es_client():
+    return get_singleton('es_client', create_es_client)
+
+
+def get_index_model():
+    return get_singleton('index_model', create_index_model)
+
+
+def get_answer_cache():
+    return get_singleton('answer_cache', AnswerCache)
+
+
+_single_flight = SingleFlight()
+_prewarm_thread = None
+
+
+def prewarm():
+    # the UI renders right away, the first question doesn't wait for the model
+    global _prewarm_thread
+    with _singletons_lock:
+        if not PREWARM or _prewarm_thread is not None:
+            return
+        _prewarm_thread = threading.Thread(target=_prewarm, name="prewarm", daemon=True)
+    _prewarm_thread.start()
+
+
+def _prewarm():
+    try:
+        get_index_model()
+        if SEARCH_BACKEND == 'minsearch':
+            get_minsearch_index('text')
+            get_minsearch_index('vector')
+        else:
+            get_es_client()
+        if MODEL_NAME:
+            llm_backends.get_backend(MODEL_NAME)
+        if RERANK_ENABLED:
+            get_reranker().load_model()
+    except Exception as e:
+        print_log(f'!! prewarm failed: {e}')
+
+
+def elastic_search_text(query, position, index_name=INDEX_NAME, num_results=SEARCH_RESULTS_NUM, source_fields=None):
     search_query = {
-        "size": SEARCH_RESULTS_NUM,
+        "size": num_results,
+        "_source": source_fields or SEARCH_SOURCE_FIELDS,
         "query": {
             "bool": {
                 "must": {
@@ -46,28 +156,106 @@ def elastic_search_text(query, position, index_name=INDEX_NAME):
         },
     }
 
-    response = es_client.search(index=index_name, body=search_query)
+    response = get_es_client().search(index=index_name, body=search_query)
     return [hit["_source"] for hit in response["hits"]["hits"]]
 
 
-def elastic_search_knn(field, vector, position, index_name="interview-questions"):
+def elastic_search_knn(field, vector, position, index_name=INDEX_NAME, num_results=SEARCH_RESULTS_NUM,
+                       num_candidates=None, source_fields=None):
     knn = {
         "field": field,
         "query_vector": vector,
-        "k": SEARCH_RESULTS_NUM,
-        "num_candidates": 10000,
+        "k": num_results,
+        # can't be lower than k
+        "num_candidates": max(num_candidates or KNN_NUM_CANDIDATES, num_results),
         "filter": {"term": {"position": position}},
     }
 
     search_query = {
         "knn": knn,
-        "_source": ["text", "section", "question", "position", "id"],
+        "size": num_results,
+        "_source": source_fields or SEARCH_SOURCE_FIELDS,
     }
 
-    es_results = es_client.search(index=index_name, body=search_query)
+    es_results = get_es_client().search(index=index_name, body=search_query)
 
     return [hit["_source"] for hit in es_results["hits"]["hits"]]
 
+def load_minsearch_index(kind):
+    import ingest
+    if kind == 'text':
+        return ingest.load_index()
+    return ingest.load_vector_index()
+
+
+def get_minsearch_index(kind):
+    # built (or memory-mapped from snapshot) once per process on first use
+    return get_singleton(f'minsearch_{kind}_index', lambda: load_minsearch_index(kind))
+
+
+def minsearch_search_text(query, position, num_results=SEARCH_RESULTS_NUM):
+    index = get_minsearch_index('text')
+    return index.search(query, {'position': position}, boost_dict=MINSEARCH_BOOST, num_results=num_results)
+
+
+def minsearch_search_knn(vector, position, num_results=SEARCH_RESULTS_NUM):
+    index = get_minsearch_index('vector')
+    return index.search(vector, {'position': position}, num_results=num_results)
+
+
+def search_text(query, position, num_results=SEARCH_RESULTS_NUM, source_fields=None):
+    # source_fields only applies to ES, minsearch returns documents as they were indexed
+    try:
+        if SEARCH_BACKEND == 'minsearch':
+            return minsearch_search_text(query, position, num_results)
+        return elastic_search_text(query, position, num_results=num_results, source_fields=source_fields)
+    except Exception:
+        metrics.count_search_error(SEARCH_BACKEND, 'text')
+        raise
+
+
+def search_knn(vector, position, num_results=SEARCH_RESULTS_NUM, num_candidates=None, source_fields=None):
+    try:
+        if SEARCH_BACKEND == 'minsearch':
+            return minsearch_search_knn(vector, position, num_results)
+        return elastic_search_knn('question_text_vector', vector, position, num_results=num_results,
+                                  num_candidates=num_candidates, source_fields=source_fields)
+    except Exception:
+        metrics.count_search_error(SEARCH_BACKEND, 'knn')
+        raise
+
+
+def encode_query(query):
+    # repeated questions skip the encoder
+    # the model is only loaded on an embedding cache miss
+    return encode_cached(INDEX_MODEL_NAME, [query], lambda texts: get_index_model().encode(texts))[0]
+
+
+# text half of hybrid searches, ES client and minsearch indices are safe to share between threads
+_search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+
+def search_hybrid(query, position, vector=None, num_results=SEARCH_RESULTS_NUM, num_candidates=None,
+                  source_fields=None):
+    # minsearch pulls in sklearn, not imported until needed
+    from minsearch import reciprocal_rank_fusion
+
+    # text search runs while the query is encoded and kNN searched,
+    # so latency is close to the slower of the two, not their sum
+    candidates = max(HYBRID_CANDIDATES, num_results)
+    # results of both searches are matched by id, fetched even when the configured fields leave it out
+    source_fields = source_fields or SEARCH_SOURCE_FIELDS
+    if 'id' not in source_fields:
+        source_fields = [*source_fields, 'id']
+    text_future = _search_executor.submit(search_text, query, position, candidates, source_fields)
+    if vector is None:
+        vector = encode_query(query)
+    knn_results = search_knn(vector, position, candidates, num_candidates, source_fields)
+    return reciprocal_rank_fusion(
+        [text_future.result(), knn_results], num_results=num_results, k=HYBRID_RRF_K,
+    )
+
+
 def response_length_prompt(max_length):
     if max_length<=200:
         return f"Responses should be brief and concise with minimal narration. One paragraph, no more than three sentences, no more than {max_length} words." 
@@ -76,8 +264,12 @@ def response_length_prompt(max_length):
     else: #if max_length<=1000:
         return f"Responses should be thorough and well structured, no more than {max_length} words." 
 
-def build_prompt(query, position_choice, search_results, max_length):
-    # TODO max_length
+def format_context_doc(doc, text):
+    return f"\nsection: {doc['section']}\nquestion: {doc['question']}\nanswer: {text}"
+
+
+def build_prompt(query, position_choice, search_results, max_length, model_choice=None):
+    # with model_choice, context is packed into the tokens left by the model's context window and the answer
     response_limits = response_length_prompt(max_length)
     prompt_template = """
 You're an experienced career coach who worked as a technical recruiter and helps {position_choice}s prepare for job interviews. Answer the QUESTION based on the CONTEXT from our knowledge database.
@@ -90,56 +282,51 @@ CONTEXT:
 {context}
 """.strip()
 
-    context = "\n\n".join(
-        [
-            f"\nsection: {doc['section']}\nquestion: {doc['question']}\nanswer: {doc['text']}"
-            for doc in search_results
-        ]
-    )
+    if CONTEXT_PACKING and model_choice:
+        prompt_tokens = count_tokens(prompt_template.format(
+            question=query, position_choice=position_choice, context="", response_limits=response_limits))
+        budget = context_token_budget(model_choice, prompt_tokens, completion_token_budget(max_length))
+        context_entries = pack_context(query, search_results, budget, format_context_doc)
+    else:
+        context_entries = [format_context_doc(doc, doc['text']) for doc in search_results]
+    context = "\n\n".join(context_entries)
 
     prompt = prompt_template.format(question=query, position_choice=position_choice, context=context, response_limits=response_limits).strip()
     if DEBUG:
-        print_log(f'Search_results: {len(search_results)}')
-        print_log(f'Prompt: {max_length} {prompt}')
+        print_log(f'Search_results: {len(search_results)}, in context: {len(context_entries)}')
+        print_log(f'Prompt: {max_length} {count_tokens(prompt)} tokens {prompt}')
         # print_log(f'Context: {context}')
     return prompt
 
 
-def llm(prompt, model_choice, max_length=100):
-    # TODO max_length in tokens?
+def llm(prompt, model_choice, max_length=None):
+    """
+    Returns (answer, tokens, response_time, model_used). Calls time out, are retried and fail over
+    to LLM_FAILOVER models (see llm_backends), model_used is the model that answered.
+    """
+    # max_length (words) caps completion tokens, judge calls are not capped
+    max_tokens = completion_token_budget(max_length) if max_length else None
     start_time = time.time()
-    if model_choice.startswith('ollama/'):
-        response = ollama_client.chat.completions.create(
-            model=model_choice.split('/')[-1],
-            messages=[{"role": "user", "content": prompt}]
-        )
-        answer = response.choices[0].message.content
-        tokens = {
-            'prompt_tokens': response.usage.prompt_tokens,
-            'completion_tokens': response.usage.completion_tokens,
-            'total_tokens': response.usage.total_tokens
-        }
-    # TODO add microsoft/phi via HF
-    elif model_choice.startswith('openai/'):
-        response = openai_client.chat.completions.create(
-            model=model_choice.split('/')[-1],
-            messages=[{"role": "user", "content": prompt}]
-        )
-        answer = response.choices[0].message.content
-        tokens = {
-            'prompt_tokens': response.usage.prompt_tokens,
-            'completion_tokens': response.usage.completion_tokens,
-            'total_tokens': response.usage.total_tokens
-        }
-    else:
-        raise ValueError(f"Unknown model choice: {model_choice}")
-    
+    answer, tokens, model_used = llm_backends.complete(prompt, model_choice, max_tokens)
     response_time = time.time() - start_time
-    
-    return answer, tokens, response_time
+    return answer, tokens, response_time, model_used
 
 
-def evaluate_relevance(question, answer):
+def llm_many(prompts, model_choice):
+    # concurrent calls, an exception in place of each failed answer
+    return llm_backends.complete_many([(prompt, model_choice, None) for prompt in prompts])
+
+
+def llm_stream(prompt, model_choice, max_length=None, stats=None):
+    """
+    Streaming variant of llm(): yields answer chunks as they are generated and,
+    once exhausted, fills stats with answer, tokens, response_time, first_token_time and model_used.
+    """
+    max_tokens = completion_token_budget(max_length) if max_length else None
+    yield from llm_backends.stream(prompt, model_choice, max_tokens, stats)
+
+
+def evaluation_prompt(question, answer):
     evaluation_prompt_template = """
     You are an expert evaluator for a Retrieval-Augmented Generation (RAG) system.
     Your task is to analyze the relevance of the generated answer to the given question.
@@ -160,9 +347,15 @@ def evaluate_relevance(question, answer):
     }}
     """.strip()
 
-    prompt = evaluation_prompt_template.format(question=question, answer=answer)
-    evaluation, tokens, _ = llm(prompt, MODEL_NAME) # 'openai/gpt-4o-mini'
+    return evaluation_prompt_template.format(question=question, answer=answer)
+
 
+def evaluate_relevance(question, answer):
+    evaluation, tokens, _, _ = llm(evaluation_prompt(question, answer), MODEL_NAME) # 'openai/gpt-4o-mini'
+    return parse_evaluation(evaluation, tokens)
+
+
+def parse_evaluation(evaluation, tokens):
     if DEBUG:
         print_log(f'Evaluation: {evaluation}')
     
@@ -196,6 +389,79 @@ def evaluate_relevance(question, answer):
             return "UNKNOWN", f"Failed to parse evaluation. {evaluation}", tokens
 
 
+def evaluate_relevance_batch(qa_pairs):
+    """
+    Evaluates several (question, answer) pairs with one judge call.
+    Returns a list of (relevance, explanation, tokens), tokens split evenly between pairs.
+    """
+    if len(qa_pairs) == 1:
+        return [evaluate_relevance(*qa_pairs[0])]
+
+    evaluation_prompt_template = """
+    You are an expert evaluator for a Retrieval-Augmented Generation (RAG) system.
+    Your task is to analyze the relevance of each generated answer to its question.
+    Based on the relevance of the generated answer, you will classify it
+    as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
+
+    Here is the data for evaluation:
+
+    {items}
+
+    Please analyze the content and context of each generated answer in relation to its question
+    and provide your evaluation as a parsable JSON list without using code blocks, one object per Id:
+
+    [
+      {{
+        "Id": 1,
+        "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+        "Explanation": "[Provide a brief explanation for your evaluation]"
+      }}
+    ]
+    """.strip()
+
+    items = "\n\n".join(
+        f"Id: {i}\nQuestion: {question}\nGenerated Answer: {answer}"
+        for i, (question, answer) in enumerate(qa_pairs, 1)
+    )
+    prompt = evaluation_prompt_template.format(items=items)
+    evaluation, tokens, _, _ = llm(prompt, MODEL_NAME)
+
+    if DEBUG:
+        print_log(f'Batch evaluation: {evaluation}')
+
+    if evaluation.startswith('```json'):
+        evaluation = evaluation[7:-3].strip()
+
+    item_tokens = {key: value // len(qa_pairs) for key, value in tokens.items()}
+    try:
+        json_evals = {int(item['Id']): item for item in json.loads(evaluation)}
+    except Exception:
+        print('!! batch evaluation parsing failed:', evaluation)
+        json_evals = {}
+
+    results = {}
+    missing = []
+    for i, (question, answer) in enumerate(qa_pairs, 1):
+        json_eval = json_evals.get(i)
+        if json_eval and 'Relevance' in json_eval:
+            results[i] = (json_eval['Relevance'], json_eval.get('Explanation', ''), item_tokens)
+        else:
+            missing.append(i)
+
+    # not in the batch response, evaluated separately with concurrent calls
+    responses = llm_many([evaluation_prompt(*qa_pairs[i - 1]) for i in missing], MODEL_NAME)
+    for i, response in zip(missing, responses):
+        if isinstance(response, Exception):
+            # only this item failed, evaluations already parsed are kept
+            print_log(f'!! evaluation failed: {response!r}')
+            results[i] = ('UNKNOWN', f'Evaluation failed. {response}',
+                          {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0})
+            continue
+        evaluation, tokens, _ = response
+        results[i] = parse_evaluation(evaluation, tokens)
+    return [results[i] for i in range(1, len(qa_pairs) + 1)]
+
+
 def calculate_openai_cost(model, tokens):
     openai_cost = 0
     # TODO update costs
@@ -207,15 +473,168 @@ def calculate_openai_cost(model, tokens):
     return openai_cost
 
 
-def get_answer(query, position_choice, model_choice, search_type, response_length):
+def get_answer_stream(query, position_choice, model_choice, search_type, response_length, answer_data,
+                      search_params=None):
+    """
+    Yields answer chunks as they are generated. Once the generator is exhausted,
+    answer_data contains the same fields get_answer() returns.
+
+    search_params optionally overrides retrieval cost per request: num_results (documents in the prompt),
+    num_candidates (kNN candidates per shard) and source_fields (document fields fetched from ES).
+    """
     positions = {"data engineer": "de", "machine learning engineer": "mle"}
     position = positions.get(position_choice, "de")
+    search_params = search_params or {}
+    num_results = search_params.get('num_results', SEARCH_RESULTS_NUM)
+    num_candidates = search_params.get('num_candidates')
+    source_fields = search_params.get('source_fields')
+
+    start_time = time.time()
+    # seconds per pipeline stage: embed, search, rerank, build_prompt, generate, evaluate and total
+    timings = {}
+    cache_key = (position, model_choice, response_length, search_type, num_results, num_candidates,
+                 tuple(source_fields or SEARCH_SOURCE_FIELDS))
+    vector = None
+    if ANSWER_CACHE:
+        answer_cache = get_answer_cache()
+        # paraphrases are matched only when the query is encoded for search anyway,
+        # text search doesn't load the encoder (exact question matches only)
+        if search_type == 'Vector' or (search_type == 'Hybrid' and answer_cache.semantic):
+            with timed(timings, 'embed'):
+                vector = encode_query(query)
+        cached = answer_cache.get(cache_key, query, vector)
+        if cached is not None:
+            # no LLM calls made for this answer
+            response_time = time.time() - start_time
+            if cached['relevance'] == 'PENDING':
+                # cache hits don't trigger judge calls
+                cached['relevance'] = 'NOT_EVALUATED'
+            cached.update({
+                'response_time': response_time,
+                'first_token_time': response_time,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'total_tokens': 0,
+                'eval_prompt_tokens': 0,
+                'eval_completion_tokens': 0,
+                'eval_total_tokens': 0,
+                'openai_cost': 0,
+                'rerank_time': 0.0,
+                'cache_hit': True,
+                'timings': {**timings, 'total': response_time},
+            })
+            if DEBUG:
+                print_log(f'Answer cache hit: {answer_cache.stats()}')
+            metrics.observe_answer(cached)
+            answer_data.update(cached)
+            yield cached['answer']
+            return
+
+    flight = None
+    if SINGLE_FLIGHT:
+        flight_key = (cache_key, normalize_query(query))
+        flight, leader = _single_flight.join(flight_key)
+        if not leader:
+            shared = yield from follow_answer(flight, start_time)
+            if shared is not None:
+                metrics.observe_answer(shared)
+                answer_data.update(shared)
+                return
+            # the leader's reader went away before any output, answer it here
+            flight = None
 
+    try:
+        for chunk in generate_answer(query, position, position_choice, model_choice, search_type, response_length,
+                                     answer_data, num_results, num_candidates, source_fields, vector, timings):
+            if flight is not None:
+                flight.add(chunk)
+            yield chunk
+        timings['total'] = time.time() - start_time
+        answer_data['timings'] = timings
+        metrics.observe_answer(answer_data)
+        # cached before the flight is left, an identical question arriving in between finds one or the other
+        if ANSWER_CACHE:
+            get_answer_cache().put(cache_key, query, answer_data, vector)
+        if flight is not None:
+            flight.finish(dict(answer_data))
+    except BaseException as e:
+        if flight is not None:
+            flight.fail(e)
+        raise
+    finally:
+        if flight is not None:
+            _single_flight.leave(flight_key, flight)
+
+
+def follow_answer(flight, start_time):
+    """
+    Replays chunks of an identical in-flight answer, returns its answer data with this request's timings,
+    or None if the leader stopped before any output.
+    """
+    first_token_time = None
+    try:
+        for chunk in flight.follow():
+            if first_token_time is None:
+                first_token_time = time.time() - start_time
+            yield chunk
+    except FlightAbandoned:
+        if first_token_time is not None:
+            raise
+        return None
+    # generated and paid for once, by the leader
+    shared = dict(flight.result)
+    response_time = time.time() - start_time
+    if shared['relevance'] == 'PENDING':
+        # the leader's conversation is evaluated, not each copy
+        shared['relevance'] = 'NOT_EVALUATED'
+    shared.update({
+        'response_time': response_time,
+        'first_token_time': first_token_time if first_token_time is not None else response_time,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'total_tokens': 0,
+        'eval_prompt_tokens': 0,
+        'eval_completion_tokens': 0,
+        'eval_total_tokens': 0,
+        'openai_cost': 0,
+        'coalesced': True,
+        # only waited for the leader's stages
+        'timings': {'total': response_time},
+    })
+    if DEBUG:
+        print_log(f'Coalesced with an in-flight answer: {_single_flight.stats()}')
+    return shared
+
+
+def generate_answer(query, position, position_choice, model_choice, search_type, response_length, answer_data,
+                    num_results, num_candidates, source_fields=None, vector=None, timings=None):
+    # retrieval, prompt, streamed generation and evaluation of one answer, stage times go to timings
+    if timings is None:
+        timings = {}
+
+    # with reranking, a larger first-stage candidate set is narrowed down by the cross-encoder
+    first_stage_results = max(RERANK_CANDIDATES, num_results) if RERANK_ENABLED else num_results
     if search_type == 'Vector':
-        vector = index_model.encode(query)
-        search_results = elastic_search_knn('question_text_vector', vector, position)
+        if vector is None:
+            with timed(timings, 'embed'):
+                vector = encode_query(query)
+        with timed(timings, 'search'):
+            search_results = search_knn(vector, position, first_stage_results, num_candidates, source_fields)
+    elif search_type == 'Hybrid':
+        # query encoding overlaps with text search here, it's counted as search
+        with timed(timings, 'search'):
+            search_results = search_hybrid(query, position, vector, first_stage_results, num_candidates,
+                                           source_fields)
     else:
-        search_results = elastic_search_text(query, position)
+        with timed(timings, 'search'):
+            search_results = search_text(query, position, first_stage_results, source_fields)
+
+    rerank_time = 0.0
+    if RERANK_ENABLED:
+        with timed(timings, 'rerank'):
+            search_results, rerank_time, reranked = get_reranker().rerank(query, search_results, num_results)
+        if DEBUG:
+            print_log(f'Rerank: {rerank_time * 1000:.0f}ms, applied: {reranked}')
 
     if response_length == 'S':
         max_length = 200
@@ -224,25 +643,53 @@ def get_answer(query, position_choice, model_choice, search_type, response_lengt
     else: # 'L'
         max_length = 1000
 
-    prompt = build_prompt(query, position_choice, search_results, max_length)
-
-    answer, tokens, response_time = llm(prompt, model_choice, max_length)
-    
-    relevance, explanation, eval_tokens = evaluate_relevance(query, answer)
+    with timed(timings, 'build_prompt'):
+        prompt = build_prompt(query, position_choice, search_results, max_length, model_choice)
+
+    stats = {}
+    yield from llm_stream(prompt, model_choice, max_length, stats)
+    answer, tokens, model_used = stats['answer'], stats['tokens'], stats['model_used']
+    timings['generate'] = stats['response_time']
+    if model_used != model_choice:
+        print_log(f'!! {model_choice} failed, answered by {model_used}')
+
+    if EVAL_ASYNC:
+        # evaluation_worker fills it in after the conversation is saved
+        relevance = 'PENDING' if random.random() < EVAL_SAMPLE_RATE else 'NOT_EVALUATED'
+        explanation = ''
+        eval_tokens = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    elif random.random() < EVAL_SAMPLE_RATE:
+        with timed(timings, 'evaluate'):
+            relevance, explanation, eval_tokens = evaluate_relevance(query, answer)
+    else:
+        relevance, explanation = 'NOT_EVALUATED', ''
+        eval_tokens = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
 
-    openai_cost = calculate_openai_cost(model_choice, tokens)
+    openai_cost = calculate_openai_cost(model_used, tokens)
  
-    return {
+    answer_data.update({
         'answer': answer,
-        'response_time': response_time,
+        'response_time': stats['response_time'],
+        'first_token_time': stats['first_token_time'],
         'relevance': relevance,
         'relevance_explanation': explanation,
-        'model_used': model_choice,
+        'model_used': model_used,
         'prompt_tokens': tokens['prompt_tokens'],
         'completion_tokens': tokens['completion_tokens'],
         'total_tokens': tokens['total_tokens'],
         'eval_prompt_tokens': eval_tokens['prompt_tokens'],
         'eval_completion_tokens': eval_tokens['completion_tokens'],
         'eval_total_tokens': eval_tokens['total_tokens'],
-        'openai_cost': openai_cost
-    }
+        'openai_cost': openai_cost,
+        'rerank_time': rerank_time,
+        'cache_hit': False,
+        'coalesced': False,
+    })
+
+
+def get_answer(query, position_choice, model_choice, search_type, response_length, search_params=None):
+    answer_data = {}
+    for _ in get_answer_stream(query, position_choice, model_choice, search_type, response_length, answer_data,
+                               search_params):
+        pass
+    return answer_data
@@ -0,0 +1,70 @@
+"""
+ANN benchmark: minsearch.IVFVectorIndex vs exact minsearch.VectorIndex on synthetic clustered vectors,
+recall@k against exact search and p50/p99 query latency per nprobe.
+
+Usage:
+    python bench_ann.py                                # 100k vectors
+    python bench_ann.py --sizes 100000 1000000 --dims 384
+"""
+import argparse
+import time
+
+import numpy as np
+
+import minsearch
+
+
+def synthetic_vectors(size, dims, clusters=1000, seed=42):
+    # mixture of gaussians, embeddings of real texts are clustered too
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dims)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=size)] + 1.5 * rng.normal(size=(size, dims)).astype(np.float32)
+    docs = [{"id": i, "position": "de" if i % 2 else "mle"} for i in range(size)]
+    return vectors, docs
+
+
+def latencies(index, queries, filter_dict, num_results, **kwargs):
+    results, times = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        results.append([doc["id"] for doc in index.search(query, filter_dict, num_results, **kwargs)])
+        times.append(time.perf_counter() - start_time)
+    return results, np.array(times) * 1000
+
+
+def recall(results, exact_results):
+    return np.mean([len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(results, exact_results)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF approximate vector search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000])
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--dtype", default="float32", choices=minsearch.VectorIndex.DTYPES)
+    args = parser.parse_args()
+
+    filter_dict = {"position": "de"}
+    for size in args.sizes:
+        vectors, docs = synthetic_vectors(size, args.dims)
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.integers(size, size=args.queries)] + 1.5 * rng.normal(size=(args.queries, args.dims))
+
+        exact = minsearch.VectorIndex(["position"], args.dtype).fit(vectors, docs)
+        start_time = time.time()
+        ivf = minsearch.IVFVectorIndex(["position"], args.dtype).fit(vectors, docs)
+        print(f"\n{size} vectors x {args.dims} dims, {ivf.n_lists} lists (fit {time.time() - start_time:.1f}s), "
+              f"recall@{args.k} with filter {filter_dict}")
+
+        exact_results, times = latencies(exact, queries, filter_dict, args.k)
+        print(f" {'exact':<10} recall 1.000  p50 {np.percentile(times, 50):7.2f} ms  p99 {np.percentile(times, 99):7.2f} ms")
+        for nprobe in args.nprobe:
+            results, times = latencies(ivf, queries, filter_dict, args.k, nprobe=nprobe)
+            print(f" {'nprobe ' + str(nprobe):<10} recall {recall(results, exact_results):.3f}  "
+                  f"p50 {np.percentile(times, 50):7.2f} ms  p99 {np.percentile(times, 99):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
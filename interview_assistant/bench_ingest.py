@@ -0,0 +1,107 @@
+"""
+Ingestion benchmark: per-document encode/index vs batched encode + bulk API.
+
+Usage:
+    python bench_ingest.py                        # qna-*.csv corpus, encoding only
+    python bench_ingest.py --rows 100000          # synthetic 100k-row corpus
+    python bench_ingest.py --es                   # also index into ELASTIC_URL (bench index)
+    python bench_ingest.py --legacy-limit 2000    # cap the slow per-document run
+"""
+import argparse
+import random
+import time
+
+from ingest import (
+    ELASTIC_URL,
+    INDEX_BATCH_SIZE,
+    Elasticsearch,
+    document_text,
+    fetch_documents,
+    generate_actions,
+    helpers,
+    load_model,
+)
+
+BENCH_INDEX_NAME = "interview-questions-bench"
+
+
+def synthetic_documents(documents, rows, seed=42):
+    # shuffle words of real Q&A pairs to keep realistic text lengths and vocabulary
+    rng = random.Random(seed)
+    synthetic = []
+    for i in range(rows):
+        doc = dict(documents[i % len(documents)])
+        words = doc["text"].split()
+        rng.shuffle(words)
+        doc["text"] = " ".join(words)
+        doc["id"] = f"syn{i:07d}"
+        synthetic.append(doc)
+    return synthetic
+
+
+def report(name, count, elapsed):
+    print(f" {name:<28} {count:>8} docs {elapsed:>9.2f}s {count / max(elapsed, 1e-9):>10.1f} docs/sec")
+
+
+def bench_encode(documents, model, batch_size, legacy_limit):
+    legacy_docs = documents[:legacy_limit]
+    start_time = time.time()
+    for doc in legacy_docs:
+        model.encode(document_text(doc))
+    report("encode per document", len(legacy_docs), time.time() - start_time)
+
+    start_time = time.time()
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        model.encode([document_text(doc) for doc in batch], batch_size=batch_size)
+    report(f"encode batched ({batch_size})", len(documents), time.time() - start_time)
+
+
+def bench_es(documents, model, batch_size, legacy_limit):
+    es_client = Elasticsearch(ELASTIC_URL)
+    es_client.indices.delete(index=BENCH_INDEX_NAME, ignore_unavailable=True)
+    es_client.indices.create(index=BENCH_INDEX_NAME)
+
+    legacy_docs = [dict(doc) for doc in documents[:legacy_limit]]
+    start_time = time.time()
+    for doc in legacy_docs:
+        doc["question_text_vector"] = model.encode(document_text(doc)).tolist()
+        es_client.index(index=BENCH_INDEX_NAME, document=doc)
+    report("encode + index per document", len(legacy_docs), time.time() - start_time)
+
+    es_client.indices.delete(index=BENCH_INDEX_NAME, ignore_unavailable=True)
+    es_client.indices.create(index=BENCH_INDEX_NAME)
+
+    batched_docs = [dict(doc) for doc in documents]
+    start_time = time.time()
+    actions = generate_actions(batched_docs, model, batch_size=batch_size, index_name=BENCH_INDEX_NAME, use_cache=False)
+    for _ in helpers.streaming_bulk(es_client, actions, chunk_size=batch_size):
+        pass
+    es_client.indices.refresh(index=BENCH_INDEX_NAME)
+    report(f"encode + bulk ({batch_size})", len(batched_docs), time.time() - start_time)
+
+    es_client.indices.delete(index=BENCH_INDEX_NAME, ignore_unavailable=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document ingestion")
+    parser.add_argument("--rows", type=int, default=0, help="synthetic corpus size (0 = qna-*.csv as is)")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    parser.add_argument("--legacy-limit", type=int, default=1000, help="max docs for the per-document run")
+    parser.add_argument("--es", action="store_true", help="also benchmark indexing into Elasticsearch")
+    args = parser.parse_args()
+
+    documents = fetch_documents()
+    if args.rows:
+        documents = synthetic_documents(documents, args.rows)
+    model = load_model()
+    model.encode(["warm up"])
+
+    print(f"\nBenchmarking {len(documents)} document(s)")
+    bench_encode(documents, model, args.batch_size, args.legacy_limit)
+    if args.es:
+        bench_es(documents, model, args.batch_size, args.legacy_limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+minsearch benchmark: queries/sec of minsearch.Index vs the previous implementation
+(per-field sklearn cosine_similarity on every query + pandas filter masks).
+
+Usage:
+    python bench_minsearch.py                              # 1k and 100k synthetic docs
+    python bench_minsearch.py --sizes 1000 100000 1000000  # add 1M (takes a while to fit)
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+import minsearch
+from ingest import fetch_documents
+
+TEXT_FIELDS = ["question", "text", "section"]
+KEYWORD_FIELDS = ["position", "id"]
+BOOST = {"question": 3.0, "section": 0.5}
+
+
+class LegacyIndex:
+    """minsearch.Index search as it was before the sparse-native engine, for comparison."""
+
+    def __init__(self, text_fields, keyword_fields, vectorizer_params={}):
+        self.text_fields = text_fields
+        self.keyword_fields = keyword_fields
+        self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
+        self.keyword_df = None
+        self.text_matrices = {}
+        self.docs = []
+
+    def fit(self, docs):
+        self.docs = docs
+        for field in self.text_fields:
+            texts = [doc.get(field, "") for doc in docs]
+            self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+        self.keyword_df = pd.DataFrame({field: [doc.get(field, "") for doc in docs] for field in self.keyword_fields})
+        return self
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, threshold=0.01):
+        query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
+        scores = np.zeros(len(self.docs))
+        for field, query_vec in query_vecs.items():
+            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
+            scores += sim * boost_dict.get(field, 1)
+        for field, value in filter_dict.items():
+            if field in self.keyword_fields:
+                mask = self.keyword_df[field] == value
+                scores = scores * mask.to_numpy()
+        top_indices = np.argpartition(scores, -num_results)[-num_results:]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
+        return [self.docs[i] for i in top_indices if scores[i] > threshold]
+
+
+def synthetic_documents(documents, size, seed=42):
+    # random word samples from the real corpus vocabulary, with real-like field lengths
+    rng = random.Random(seed)
+    words = {field: " ".join(doc[field] for doc in documents).split() for field in TEXT_FIELDS}
+    lengths = {field: [len(doc[field].split()) for doc in documents] for field in TEXT_FIELDS}
+    positions = sorted({doc["position"] for doc in documents})
+    return [
+        {
+            "id": f"syn{i:07d}",
+            "position": positions[i % len(positions)],
+            **{field: " ".join(rng.choices(words[field], k=min(rng.choice(lengths[field]), 60))) for field in TEXT_FIELDS},
+        }
+        for i in range(size)
+    ]
+
+
+def queries_per_second(index, queries, seconds=3.0):
+    count = 0
+    start_time = time.time()
+    while time.time() - start_time < seconds:
+        query, position = queries[count % len(queries)]
+        index.search(query, {"position": position}, boost_dict=BOOST, num_results=5)
+        count += 1
+    return count / (time.time() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark minsearch.Index search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each measurement")
+    args = parser.parse_args()
+
+    documents = fetch_documents()
+    queries = [(doc["question"], doc["position"]) for doc in documents]
+
+    print(f"\n{'docs':>9} {'legacy q/s':>12} {'minsearch q/s':>14} {'speedup':>8} {'same results':>13}")
+    for size in args.sizes:
+        docs = synthetic_documents(documents, size)
+        legacy = LegacyIndex(TEXT_FIELDS, KEYWORD_FIELDS).fit(docs)
+        index = minsearch.Index(TEXT_FIELDS, KEYWORD_FIELDS).fit(docs)
+
+        same = sum(
+            [d["id"] for d in legacy.search(q, {"position": p}, BOOST, 5)]
+            == [d["id"] for d in index.search(q, {"position": p}, BOOST, 5)]
+            for q, p in queries[:200]
+        )
+        legacy_qps = queries_per_second(legacy, queries, args.seconds)
+        qps = queries_per_second(index, queries, args.seconds)
+        print(f"{size:>9} {legacy_qps:>12.1f} {qps:>14.1f} {qps / legacy_qps:>7.1f}x {same:>9}/200")
+
+
+if __name__ == "__main__":
+    main()
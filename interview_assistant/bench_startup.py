@@ -0,0 +1,84 @@
+"""
+Startup benchmark: import time of app modules (python -X importtime) and
+building the minsearch index from CSV files (refit) vs loading its snapshot.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --rows 100000     # synthetic corpus
+    python bench_startup.py --modules app_rag db
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import minsearch
+from bench_minsearch import synthetic_documents, TEXT_FIELDS, KEYWORD_FIELDS
+from ingest import fetch_documents
+
+
+def timed(name, fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.time()
+        result = fn()
+        best = min(best, time.time() - start_time)
+    print(f" {name:<32} {best * 1000:>10.1f} ms")
+    return result
+
+
+def import_time(module, top=5):
+    # fresh interpreter per module, nothing is imported yet
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(f" {module:<32} failed: {result.stderr.strip().splitlines()[-1]}")
+        return None
+    # "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip(), len(name) - len(name.lstrip())))
+    total = next(cumulative for cumulative, name, _ in rows if name == module)
+    # heaviest direct imports of the module
+    heaviest = sorted((row for row in rows if row[2] == 3), reverse=True)[:top]
+    print(f" {module:<32} {total / 1000:>10.1f} ms  "
+          + ", ".join(f"{name} {cumulative / 1000:.0f}" for cumulative, name, _ in heaviest))
+    return total / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark minsearch index startup")
+    parser.add_argument("--rows", type=int, default=0, help="synthetic corpus size (0 = qna-*.csv as is)")
+    parser.add_argument("--modules", nargs="+", default=["app_rag", "db", "ingest", "minsearch"],
+                        help="modules to profile with python -X importtime")
+    args = parser.parse_args()
+
+    print("\nImport time (cumulative), heaviest imports in ms")
+    for module in args.modules:
+        import_time(module)
+
+    documents = fetch_documents()
+    if args.rows:
+        documents = synthetic_documents(documents, args.rows)
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "minsearch-index")
+
+    print(f"\nStartup with {len(documents)} document(s)")
+    index = timed("refit (Index.fit)", lambda: minsearch.Index(TEXT_FIELDS, KEYWORD_FIELDS).fit(documents))
+    timed("save snapshot", lambda: index.save(snapshot_path), repeat=1)
+    timed("load snapshot (read)", lambda: minsearch.Index.load(snapshot_path, mmap=False))
+    loaded = timed("load snapshot (mmap)", lambda: minsearch.Index.load(snapshot_path, mmap=True))
+    timed("first query after mmap load", lambda: loaded.search("What is data engineering?", {"position": "de"}), repeat=1)
+
+    shutil.rmtree(os.path.dirname(snapshot_path), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import re
+import math
+import threading
+
+
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "1") == "1"
+# at most that many tokens of retrieved documents in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Ollama runs models with a 2048 token context window unless num_ctx is changed,
+# longer prompts are silently cut from the start
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "2048"))
+MODEL_CONTEXT_WINDOWS = {
+    "openai/gpt-3.5-turbo": 16385,
+    "openai/gpt-4o": 128000,
+    "openai/gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+MIN_CONTEXT_TOKENS = 200
+# answer length is asked for in words, max_tokens leaves some headroom over it
+TOKENS_PER_WORD = 1.5
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "what", "when", "which", "who", "why",
+    "with", "you", "your",
+}
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    # tiktoken is optional (and downloads its BPE file on first use), chars / 4 otherwise
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"!! tiktoken is not available, estimating tokens as characters / 4: {e}", flush=True)
+                _encoding = None
+            _encoding_loaded = True
+        return _encoding
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def context_window(model_choice):
+    if model_choice.startswith("ollama/"):
+        return OLLAMA_NUM_CTX
+    return MODEL_CONTEXT_WINDOWS.get(model_choice, DEFAULT_CONTEXT_WINDOW)
+
+
+def completion_token_budget(max_length):
+    # max_length is in words
+    return math.ceil(max_length * TOKENS_PER_WORD)
+
+
+def context_token_budget(model_choice, prompt_tokens, max_tokens):
+    # whatever is left of the context window after instructions, question and the answer,
+    # never more: a longer prompt would be cut by the model or leave no room for the answer
+    available = context_window(model_choice) - prompt_tokens - max_tokens
+    if available < MIN_CONTEXT_TOKENS:
+        print(f"!! only {max(available, 0)} context token(s) left in the {model_choice} context window", flush=True)
+    return max(min(CONTEXT_TOKEN_BUDGET, available), 0)
+
+
+def terms(text):
+    return {word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS}
+
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+|\n+", text.strip()) if sentence]
+
+
+def select_sentences(query_terms, text, budget):
+    """
+    Returns text shortened to about budget tokens: sentences sharing most terms with the query
+    are kept (earlier ones first on ties), in their original order. Empty if none fits.
+    """
+    sentences = split_sentences(text)
+    costs = [count_tokens(sentence) + 1 for sentence in sentences]
+    ranked = sorted(range(len(sentences)), key=lambda i: (-len(query_terms & terms(sentences[i])), i))
+    selected, used = [], 0
+    for i in ranked:
+        if used + costs[i] <= budget:
+            selected.append(i)
+            used += costs[i]
+    return " ".join(sentences[i] for i in sorted(selected))
+
+
+def pack_context(query, docs, budget, format_doc):
+    """
+    Fits documents (best first) into budget tokens: documents are added whole while they fit,
+    the next ones keep only their sentences most relevant to the query.
+
+    Args:
+        query (str): User question.
+        docs (list of dict): Search results, best first.
+        budget (int): Token budget for the whole context.
+        format_doc (callable): format_doc(doc, text) -> context entry with doc's text replaced by text.
+
+    Returns:
+        list of str: Context entries, about budget tokens together at most.
+    """
+    query_terms = terms(query)
+    entries = []
+    remaining = budget
+    for doc in docs:
+        entry = format_doc(doc, doc["text"])
+        cost = count_tokens(entry) + 2
+        if cost > remaining:
+            header_cost = count_tokens(format_doc(doc, "")) + 2
+            text = select_sentences(query_terms, doc["text"], remaining - header_cost)
+            if not text:
+                continue
+            entry = format_doc(doc, text)
+            cost = count_tokens(entry) + 2
+        entries.append(entry)
+        remaining -= cost
+        if remaining < MIN_CONTEXT_TOKENS / 4:
+            break
+    return entries
@@ -1,28 +1,147 @@
 import os
+import time
+import threading
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from psycopg2.extras import DictCursor
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
+import metrics
+
+# db_prep.py writes and deletes a test row after init_db(), importing db has no side effects
 RUN_TIMEZONE_CHECK = os.getenv('RUN_TIMEZONE_CHECK', '1') == '1'
 
 TZ_INFO = os.getenv("TZ", "Europe/Kyiv")
 tz = ZoneInfo(TZ_INFO)
 
 
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK = float(os.getenv("DB_POOL_HEALTH_CHECK", "30"))  # ping connections idle longer than that
+
+# request_timings columns, seconds per stage of app_rag answer_data['timings'] (+ save)
+TIMING_STAGES = ["embed", "search", "rerank", "build_prompt", "generate", "evaluate", "save", "total"]
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises when exhausted, the semaphore makes callers wait instead
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_last_used = {}
+pool_stats = {
+    "acquired": 0,
+    "in_use": 0,
+    "wait_time_total": 0.0,
+    "wait_time_max": 0.0,
+    "timeouts": 0,
+    "reconnects": 0,
+}
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(
+                DB_POOL_MIN_SIZE,
+                DB_POOL_MAX_SIZE,
+                host=os.getenv("POSTGRES_HOST", "postgres"),
+                database=os.getenv("POSTGRES_DB", "interview_assistant"),
+                user=os.getenv("POSTGRES_USER", "your_username"),
+                password=os.getenv("POSTGRES_PASSWORD", "your_password"),
+            )
+        return _pool
+
+
+def is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.time() - _last_used.get(id(conn), 0) < DB_POOL_HEALTH_CHECK:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("POSTGRES_HOST", "postgres"),
-        database=os.getenv("POSTGRES_DB", "interview_assistant"),
-        user=os.getenv("POSTGRES_USER", "your_username"),
-        password=os.getenv("POSTGRES_PASSWORD", "your_password"),
-    )
+    """Takes a connection from the process-wide pool, return it with release_db_connection()."""
+    start_time = time.time()
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        with _pool_lock:
+            pool_stats["timeouts"] += 1
+        raise PoolError(f"no free database connection in {DB_POOL_TIMEOUT}s (DB_POOL_MAX_SIZE={DB_POOL_MAX_SIZE})")
+    wait_time = time.time() - start_time
+
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+        # after a Postgres restart every idle connection is dead, discard them until a working one comes up
+        discarded = 0
+        while not is_healthy(conn):
+            # ids are reused by new connection objects, a stale last use would skip their check
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            discarded += 1
+            with _pool_lock:
+                pool_stats["reconnects"] += 1
+            if discarded > DB_POOL_MAX_SIZE:
+                raise psycopg2.OperationalError(f"no healthy database connection after {discarded} attempt(s)")
+            conn = pool.getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+
+    with _pool_lock:
+        pool_stats["acquired"] += 1
+        pool_stats["in_use"] += 1
+        pool_stats["wait_time_total"] += wait_time
+        pool_stats["wait_time_max"] = max(pool_stats["wait_time_max"], wait_time)
+    return conn
+
+
+def release_db_connection(conn):
+    # the pool rolls back unfinished transactions and drops closed connections
+    if conn.closed:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.time()
+    try:
+        get_pool().putconn(conn, close=bool(conn.closed))
+    finally:
+        with _pool_lock:
+            pool_stats["in_use"] -= 1
+        _pool_slots.release()
+
+
+def get_pool_stats():
+    with _pool_lock:
+        stats = dict(pool_stats)
+    stats["wait_time_avg"] = stats["wait_time_total"] / stats["acquired"] if stats["acquired"] else 0.0
+    stats["max_size"] = DB_POOL_MAX_SIZE
+    return stats
+
+
+metrics.register_gauge("rag_db_pool_connections_in_use", "Database connections taken from the pool",
+                       lambda: pool_stats["in_use"])
+metrics.register_gauge("rag_db_pool_max_size", "Database connection pool size", lambda: DB_POOL_MAX_SIZE)
+metrics.register_gauge("rag_db_pool_wait_seconds_max", "Longest wait for a free database connection",
+                       lambda: pool_stats["wait_time_max"])
+metrics.register_gauge("rag_db_pool_timeouts", "Waits for a free database connection that timed out",
+                       lambda: pool_stats["timeouts"])
 
 
 def init_db():
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS timing_rollups")
+            cur.execute("DROP TABLE IF EXISTS conversation_rollups")
+            cur.execute("DROP TABLE IF EXISTS request_timings")
             cur.execute("DROP TABLE IF EXISTS feedback")
             cur.execute("DROP TABLE IF EXISTS conversations")
 
@@ -34,6 +153,7 @@ def init_db():
                     position TEXT NOT NULL,
                     model_used TEXT NOT NULL,
                     response_time FLOAT NOT NULL,
+                    first_token_time FLOAT,
                     relevance TEXT NOT NULL,
                     relevance_explanation TEXT NOT NULL,
                     prompt_tokens INTEGER NOT NULL,
@@ -43,6 +163,7 @@ def init_db():
                     eval_completion_tokens INTEGER NOT NULL,
                     eval_total_tokens INTEGER NOT NULL,
                     openai_cost FLOAT NOT NULL,
+                    cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
@@ -54,25 +175,66 @@ def init_db():
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
+            # NULL for stages a request didn't go through (cache hits, coalesced answers, async evaluation)
+            cur.execute(f"""
+                CREATE TABLE request_timings (
+                    conversation_id TEXT PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+                    {", ".join(f"{stage}_time FLOAT" for stage in TIMING_STAGES)},
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """)
+            cur.execute("CREATE INDEX request_timings_timestamp_idx ON request_timings (timestamp)")
+            # recent conversations (optionally of one relevance) and time-bounded scans
+            cur.execute("CREATE INDEX conversations_timestamp_idx ON conversations (timestamp)")
+            cur.execute("CREATE INDEX conversations_relevance_timestamp_idx ON conversations (relevance, timestamp)")
+            cur.execute("CREATE INDEX feedback_timestamp_idx ON feedback (timestamp)")
+            cur.execute("CREATE INDEX feedback_conversation_id_idx ON feedback (conversation_id)")
+
+            # per-minute aggregates for Grafana, maintained by rollup.py
+            cur.execute("""
+                CREATE TABLE conversation_rollups (
+                    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+                    model_used TEXT NOT NULL,
+                    relevance TEXT NOT NULL,
+                    conversations INTEGER NOT NULL,
+                    cache_hits INTEGER NOT NULL,
+                    response_time_sum FLOAT NOT NULL,
+                    response_time_max FLOAT NOT NULL,
+                    first_token_time_sum FLOAT NOT NULL,
+                    first_token_count INTEGER NOT NULL,
+                    total_tokens BIGINT NOT NULL,
+                    openai_cost FLOAT NOT NULL,
+                    PRIMARY KEY (bucket, model_used, relevance)
+                )
+            """)
+            # percentiles don't add up, they are per minute
+            cur.execute(f"""
+                CREATE TABLE timing_rollups (
+                    bucket TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+                    requests INTEGER NOT NULL,
+                    {", ".join(f"{stage}_p50 FLOAT, {stage}_p95 FLOAT" for stage in TIMING_STAGES)}
+                )
+            """)
         conn.commit()
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def save_conversation(conversation_id, question, answer_data, position, timestamp=None):
     if timestamp is None:
         timestamp = datetime.now(tz)
 
+    start_time = time.time()
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
             cur.execute(
                 """
                 INSERT INTO conversations 
-                (id, question, answer, position, model_used, response_time, relevance, 
+                (id, question, answer, position, model_used, response_time, first_token_time, relevance, 
                 relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
-                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, cache_hit, timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
                 (
                     conversation_id,
@@ -81,6 +243,7 @@ def save_conversation(conversation_id, question, answer_data, position, timestam
                     position,
                     answer_data["model_used"],
                     answer_data["response_time"],
+                    answer_data.get("first_token_time"),
                     answer_data["relevance"],
                     answer_data["relevance_explanation"],
                     answer_data["prompt_tokens"],
@@ -90,12 +253,66 @@ def save_conversation(conversation_id, question, answer_data, position, timestam
                     answer_data["eval_completion_tokens"],
                     answer_data["eval_total_tokens"],
                     answer_data["openai_cost"],
+                    answer_data.get("cache_hit", False),
                     timestamp
                 ),
             )
+            if "timings" in answer_data:
+                # save time is the connection wait and the insert above, the commit isn't included
+                save_timings(cur, conversation_id, {**answer_data["timings"], "save": time.time() - start_time},
+                             timestamp)
         conn.commit()
     finally:
-        conn.close()
+        release_db_connection(conn)
+    metrics.observe_stage("save", time.time() - start_time)
+
+
+def save_timings(cur, conversation_id, timings, timestamp):
+    columns = [stage for stage in TIMING_STAGES if stage in timings]
+    cur.execute(
+        f"""
+        INSERT INTO request_timings (conversation_id, {", ".join(f"{stage}_time" for stage in columns)}, timestamp)
+        VALUES (%s, {", ".join(["%s"] * len(columns))}, %s)
+        """,
+        (conversation_id, *[timings[stage] for stage in columns], timestamp),
+    )
+
+
+def save_evaluations(evaluations, evaluate_time=None):
+    """
+    Updates relevance of saved conversations, evaluations are (conversation_id, relevance, explanation, eval_tokens).
+    evaluate_time (seconds of the judge call evaluating them) is saved as their evaluate stage time.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                UPDATE conversations
+                SET relevance = %s, relevance_explanation = %s,
+                    eval_prompt_tokens = %s, eval_completion_tokens = %s, eval_total_tokens = %s
+                WHERE id = %s
+                """,
+                [
+                    (
+                        relevance,
+                        explanation,
+                        eval_tokens["prompt_tokens"],
+                        eval_tokens["completion_tokens"],
+                        eval_tokens["total_tokens"],
+                        conversation_id,
+                    )
+                    for conversation_id, relevance, explanation, eval_tokens in evaluations
+                ],
+            )
+            if evaluate_time is not None:
+                cur.executemany(
+                    "UPDATE request_timings SET evaluate_time = %s WHERE conversation_id = %s",
+                    [(evaluate_time, conversation_id) for conversation_id, _, _, _ in evaluations],
+                )
+        conn.commit()
+    finally:
+        release_db_connection(conn)
 
 
 def save_feedback(conversation_id, feedback, timestamp=None):
@@ -111,7 +328,7 @@ def save_feedback(conversation_id, feedback, timestamp=None):
             )
         conn.commit()
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def get_recent_conversations(limit=5, relevance=None):
@@ -130,7 +347,7 @@ def get_recent_conversations(limit=5, relevance=None):
             cur.execute(query, (limit,))
             return cur.fetchall()
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def get_feedback_stats():
@@ -145,7 +362,7 @@ def get_feedback_stats():
             """)
             return cur.fetchone()
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def check_timezone():
@@ -194,8 +411,5 @@ def check_timezone():
         print(f"An error occurred: {e}")
         conn.rollback()
     finally:
-        conn.close()
-
+        release_db_connection(conn)
 
-if RUN_TIMEZONE_CHECK:
-    check_timezone()
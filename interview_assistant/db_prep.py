@@ -1,13 +1,14 @@
 import os
 from dotenv import load_dotenv
 
-os.environ["RUN_TIMEZONE_CHECK"] = "0"
-
-from db import init_db
-
+# db reads its settings (RUN_TIMEZONE_CHECK, TZ, pool size) at import
 load_dotenv()
 
+from db import init_db, check_timezone, RUN_TIMEZONE_CHECK
+
 if __name__ == "__main__":
     print("Initializing database...")
     init_db()
     print(" Database initialization finished.")
+    if RUN_TIMEZONE_CHECK:
+        check_timezone()
@@ -19,7 +19,7 @@ fi
 echo
 echo '2. BUILDING DOCKER IMAGE...'
 echo
-docker compose build streamlit
+docker compose build streamlit rollup
 
 sleep 5
 
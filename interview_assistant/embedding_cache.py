@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+EMBEDDING_CACHE_LRU_SIZE = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "10000"))
+SQLITE_MAX_VARIABLES = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by (model name, sha256(text)): SQLite blob table on disk
+    with an in-process LRU in front of it.
+
+    Attributes:
+        model_name (str): Name of the model the cached vectors were produced by.
+        hits (int): Number of unique texts of a batch served from the cache.
+        misses (int): Number of unique texts of a batch that had to be encoded.
+    """
+
+    def __init__(self, model_name, path=EMBEDDING_CACHE_PATH, lru_size=EMBEDDING_CACHE_LRU_SIZE):
+        self.model_name = model_name
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # shared between Streamlit threads, and between app and ingest processes (WAL)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def _lru_put(self, key, vector):
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def get_many(self, hashes):
+        found = {}
+        with self.lock:
+            missing = []
+            for key in hashes:
+                if key in self.lru:
+                    self.lru.move_to_end(key)
+                    found[key] = self.lru[key]
+                else:
+                    missing.append(key)
+
+            for start in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                chunk = missing[start:start + SQLITE_MAX_VARIABLES]
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [self.model_name, *chunk],
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._lru_put(key, vector)
+        return found
+
+    def put_many(self, items):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            self.conn.commit()
+            for key, vector in items:
+                self._lru_put(key, np.asarray(vector, dtype=np.float32))
+
+    def encode(self, texts, encode_fn):
+        """
+        Returns embeddings of texts as a (len(texts), dims) float32 matrix, calling
+        encode_fn(list of texts) only for texts not cached yet.
+        """
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        found = self.get_many(unique_hashes)
+
+        missing = {key: text for key, text in zip(hashes, texts) if key not in found}
+        # unique texts, a text repeated in one batch is encoded once and isn't a hit
+        with self.lock:
+            self.hits += len(unique_hashes) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            vectors = encode_fn(list(missing.values()))
+            items = list(zip(missing.keys(), vectors))
+            self.put_many(items)
+            found.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in items)
+
+        return np.vstack([found[key] for key in hashes])
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name):
+    # one cache (and SQLite connection) per model per process
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
+
+
+def encode_cached(model_name, texts, encode_fn, use_cache=EMBEDDING_CACHE):
+    if not use_cache:
+        return np.asarray(encode_fn(texts), dtype=np.float32)
+    return get_embedding_cache(model_name).encode(texts, encode_fn)
@@ -0,0 +1,284 @@
+"""
+Retrieval evaluation harness, like notebooks/evaluate-*.ipynb but for every search backend of the app:
+hit rate and MRR over ground-truth questions, per-query latency (p50/p95/p99, histogram) and throughput
+with a thread or process pool, and a JSON report that can be compared with a baseline.
+
+Backends are <search backend>-<search type>[+rerank], run through the same app_rag functions the app uses:
+    minsearch-text, minsearch-vector, minsearch-hybrid, es-text, es-vector, es-hybrid,
+    minsearch-batch (all questions at once with minsearch.Index.search_many)
+es-* backends query ELASTIC_URL, or with --es-local a stand-in client answering the same ES queries
+from minsearch indices. Vector and hybrid search and +rerank need sentence-transformers.
+
+Usage:
+    python evaluate_retrieval.py
+    python evaluate_retrieval.py --backends minsearch-text minsearch-vector minsearch-hybrid --workers 8
+    python evaluate_retrieval.py --backends es-text es-vector es-hybrid --es-local --pool process
+    python evaluate_retrieval.py --backends minsearch-text minsearch-text+rerank --output report.json
+    python evaluate_retrieval.py --baseline report.json     # exit code 1 on quality or latency regressions
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import app_rag
+from ingest import encode_texts
+
+GROUND_TRUTH_PATH = "../notebooks/ground-truth-data.csv"
+REPORT_PATH = "retrieval-report.json"
+MINSEARCH_BOOST = app_rag.MINSEARCH_BOOST
+SEARCH_BACKENDS = {"minsearch": "minsearch", "es": "elasticsearch"}
+SEARCH_TYPES = ("text", "vector", "hybrid", "batch")
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+def hit_rate(relevance_total):
+    return sum(True in line for line in relevance_total) / len(relevance_total)
+
+
+def mrr(relevance_total):
+    total_score = 0.0
+    for line in relevance_total:
+        if True in line:
+            total_score += 1 / (line.index(True) + 1)
+    return total_score / len(relevance_total)
+
+
+def load_ground_truth(path=GROUND_TRUTH_PATH):
+    return pd.read_csv(path).to_dict(orient="records")
+
+
+def relevance(ground_truth, results_total):
+    # results_total: list of lists of document ids
+    return [[doc_id == q["document"] for doc_id in results] for q, results in zip(ground_truth, results_total)]
+
+
+class LocalElasticsearch:
+    """
+    Elasticsearch client stand-in for evaluation without a cluster: answers the multi_match and kNN
+    queries app_rag builds (with a position term filter) from minsearch indices.
+    """
+
+    def __init__(self, get_index=app_rag.get_minsearch_index):
+        self.get_index = get_index
+
+    @staticmethod
+    def filter_dict(filter_clause):
+        return dict(filter_clause.get("term", {})) if filter_clause else {}
+
+    def search(self, index=None, body=None):
+        start_time = time.perf_counter()
+        if "knn" in body:
+            knn = body["knn"]
+            docs = self.get_index("vector").search(
+                np.asarray(knn["query_vector"], dtype=np.float32),
+                self.filter_dict(knn.get("filter")),
+                num_results=knn["k"],
+            )
+        else:
+            bool_query = body["query"]["bool"]
+            multi_match = bool_query["must"]["multi_match"]
+            boost_dict = {}
+            for field in multi_match["fields"]:
+                name, _, boost = field.partition("^")
+                boost_dict[name] = float(boost or 1)
+            docs = self.get_index("text").search(
+                multi_match["query"],
+                self.filter_dict(bool_query.get("filter")),
+                boost_dict=boost_dict,
+                num_results=body.get("size", 10),
+            )
+        source_fields = body.get("_source")
+        hits = [{"_source": {key: doc[key] for key in source_fields} if source_fields else doc} for doc in docs]
+        return {"took": int((time.perf_counter() - start_time) * 1000), "hits": {"hits": hits}}
+
+
+def parse_backend(name):
+    # "minsearch-hybrid+rerank" -> ("minsearch", "hybrid", True)
+    base_name, rerank = (name[:-len("+rerank")], True) if name.endswith("+rerank") else (name, False)
+    backend, _, search_type = base_name.partition("-")
+    if backend not in SEARCH_BACKENDS or search_type not in SEARCH_TYPES or (search_type == "batch" and
+                                                                             (backend != "minsearch" or rerank)):
+        raise ValueError(f"Unknown backend: {name}")
+    return backend, search_type, rerank
+
+
+_config = {}
+_reranker = None
+
+
+def init_worker(config):
+    # also the initializer of pool processes, each builds (or memory-maps) its own indices
+    global _reranker
+    _config.update(config)
+    app_rag.SEARCH_BACKEND = SEARCH_BACKENDS[config["backend"]]
+    if config["es_local"]:
+        app_rag.get_singleton("es_client", LocalElasticsearch)
+    if config["rerank"] and _reranker is None:
+        from reranker import Reranker
+        # no time budget, the quality of full reranking is measured
+        _reranker = Reranker(time_budget=None)
+
+
+def search_one(q):
+    """Returns (document ids, latency in seconds, error or None) of one ground-truth question."""
+    num_results = _config["num_results"]
+    first_stage_results = max(_config["rerank_candidates"], num_results) if _config["rerank"] else num_results
+    search_type = _config["search_type"]
+    start_time = time.perf_counter()
+    try:
+        if search_type == "text":
+            docs = app_rag.search_text(q["question"], q["position"], first_stage_results)
+        elif search_type == "vector":
+            docs = app_rag.search_knn(app_rag.encode_query(q["question"]), q["position"], first_stage_results)
+        else:
+            docs = app_rag.search_hybrid(q["question"], q["position"], None, first_stage_results)
+        if _config["rerank"]:
+            docs, _, _ = _reranker.rerank(q["question"], docs, num_results)
+        return [doc["id"] for doc in docs], time.perf_counter() - start_time, None
+    except Exception as e:
+        return [], time.perf_counter() - start_time, repr(e)
+
+
+def search_batch(ground_truth, num_results):
+    # minsearch.Index.search_many, latency is the batch time split between questions
+    index = app_rag.get_minsearch_index("text")
+    start_time = time.perf_counter()
+    results_total = index.search_many(
+        [q["question"] for q in ground_truth],
+        [{"position": q["position"]} for q in ground_truth],
+        boost_dict=MINSEARCH_BOOST,
+        num_results=num_results,
+    )
+    elapsed = time.perf_counter() - start_time
+    return [([doc["id"] for doc in results], elapsed / len(ground_truth), None) for results in results_total]
+
+
+def latency_summary(latencies_ms):
+    counts, _ = np.histogram(latencies_ms, bins=[0] + LATENCY_BUCKETS_MS + [np.inf])
+    return {
+        "mean": float(np.mean(latencies_ms)),
+        "p50": float(np.percentile(latencies_ms, 50)),
+        "p95": float(np.percentile(latencies_ms, 95)),
+        "p99": float(np.percentile(latencies_ms, 99)),
+        "max": float(np.max(latencies_ms)),
+        # upper bucket bound in ms -> number of queries
+        "histogram": {str(le): int(count) for le, count in zip(LATENCY_BUCKETS_MS + ["+Inf"], counts)},
+    }
+
+
+def run_backend(name, ground_truth, args):
+    backend, search_type, rerank = parse_backend(name)
+    config = {
+        "backend": backend,
+        "search_type": search_type,
+        "rerank": rerank,
+        "num_results": args.num_results,
+        "rerank_candidates": args.rerank_candidates,
+        "es_local": args.es_local,
+    }
+    init_worker(config)
+
+    start_time = time.perf_counter()
+    if search_type == "batch":
+        outcomes = search_batch(ground_truth, args.num_results)
+    elif args.pool == "process":
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(config,)) as pool:
+            outcomes = list(pool.map(search_one, ground_truth, chunksize=16))
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            outcomes = list(pool.map(search_one, ground_truth))
+    wall_time = time.perf_counter() - start_time
+
+    errors = [error for _, _, error in outcomes if error]
+    if errors:
+        print(f"!! {name}: {len(errors)} failed question(s), first error: {errors[0]}")
+    relevance_total = relevance(ground_truth, [ids for ids, _, _ in outcomes])
+    return {
+        "hit_rate": hit_rate(relevance_total),
+        "mrr": mrr(relevance_total),
+        "queries": len(ground_truth),
+        "errors": len(errors),
+        "throughput_qps": len(ground_truth) / wall_time,
+        "latency_ms": latency_summary(np.array([latency for _, latency, _ in outcomes]) * 1000),
+    }
+
+
+def compare(report, baseline, max_quality_drop, max_latency_increase):
+    """Returns regressions of report vs baseline: quality drops and p95 latency increases (relative)."""
+    regressions = []
+    for name, metrics in report["backends"].items():
+        base = baseline.get("backends", {}).get(name)
+        if base is None:
+            continue
+        for metric in ("hit_rate", "mrr"):
+            if base[metric] - metrics[metric] > max_quality_drop:
+                regressions.append(f"{name} {metric} {base[metric]:.4f} -> {metrics[metric]:.4f}")
+        base_p95, p95 = base["latency_ms"]["p95"], metrics["latency_ms"]["p95"]
+        if base_p95 > 0 and (p95 - base_p95) / base_p95 > max_latency_increase:
+            regressions.append(f"{name} p95 latency {base_p95:.2f} -> {p95:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency over ground-truth questions")
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--backends", nargs="+", default=["minsearch-batch", "minsearch-text"])
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--es-local", action="store_true", help="answer es-* queries from minsearch indices")
+    parser.add_argument("--rerank-candidates", type=int, default=30, help="first-stage results of +rerank backends")
+    parser.add_argument("--output", default=REPORT_PATH, help="JSON report path")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--max-quality-drop", type=float, default=0.01, help="hit rate / MRR, absolute")
+    parser.add_argument("--max-latency-increase", type=float, default=0.5, help="p95 latency, relative")
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth(args.ground_truth)
+    search_types = {parse_backend(name)[1] for name in args.backends}
+    if search_types & {"vector", "hybrid"}:
+        # encode questions once, searches then hit the embedding cache like repeated questions in the app
+        encode_texts([q["question"] for q in ground_truth])
+
+    print(f"\nEvaluating {len(ground_truth)} question(s), {args.num_results} result(s), "
+          f"{args.workers} {args.pool} worker(s)")
+    print(f" {'backend':<24} {'hit_rate':>8} {'mrr':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q/s':>9}")
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "ground_truth": args.ground_truth,
+        "num_results": args.num_results,
+        "workers": args.workers,
+        "pool": args.pool,
+        "es_local": args.es_local,
+        "backends": {},
+    }
+    for name in args.backends:
+        metrics = run_backend(name, ground_truth, args)
+        report["backends"][name] = metrics
+        latency = metrics["latency_ms"]
+        print(f" {name:<24} {metrics['hit_rate']:>8.4f} {metrics['mrr']:>6.4f} {latency['p50']:>8.2f} "
+              f"{latency['p95']:>8.2f} {latency['p99']:>8.2f} {metrics['throughput_qps']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "wt", encoding="utf-8") as f_out:
+            json.dump(report, f_out, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "rt", encoding="utf-8") as f_in:
+            regressions = compare(report, json.load(f_in), args.max_quality_drop, args.max_latency_increase)
+        if regressions:
+            print(f"\n!! {len(regressions)} regression(s) vs {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import time
+import queue
+import threading
+
+import metrics
+from app_rag import MODEL_NAME, evaluate_relevance_batch, print_log
+from db import save_evaluations
+
+
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "3"))
+# keep batched judge prompts within small context windows (Ollama default is 2048 tokens)
+EVAL_BATCH_MAX_CHARS = int(os.getenv("EVAL_BATCH_MAX_CHARS", "6000"))
+EVAL_BATCH_WAIT = float(os.getenv("EVAL_BATCH_WAIT", "2"))  # seconds to wait for a batch to fill up
+EVAL_QUEUE_SIZE = int(os.getenv("EVAL_QUEUE_SIZE", "1000"))
+
+
+class EvaluationWorker:
+    """
+    Background thread evaluating relevance of saved conversations.
+
+    Submitted (conversation_id, question, answer) items are grouped into batches of up to
+    EVAL_BATCH_SIZE evaluated with one judge call, results are written back to conversations.
+    """
+
+    def __init__(self, batch_size=EVAL_BATCH_SIZE, batch_wait=EVAL_BATCH_WAIT, queue_size=EVAL_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="evaluation-worker", daemon=True)
+        self.thread.start()
+
+    def submit(self, conversation_id, question, answer):
+        try:
+            self.queue.put_nowait((conversation_id, question, answer))
+            return True
+        except queue.Full:
+            print_log(f'!! evaluation queue is full, skipping {conversation_id}')
+            save_evaluations([(conversation_id, 'NOT_EVALUATED', 'Evaluation queue is full',
+                               {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0})])
+            return False
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        size = len(batch[0][1]) + len(batch[0][2])
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.batch_size and size < EVAL_BATCH_MAX_CHARS:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[1]) + len(item[2])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                start_time = time.time()
+                results = evaluate_relevance_batch([(question, answer) for _, question, answer in batch])
+                save_evaluations([
+                    (conversation_id, relevance, explanation, eval_tokens)
+                    for (conversation_id, _, _), (relevance, explanation, eval_tokens) in zip(batch, results)
+                ], evaluate_time=time.time() - start_time)
+                metrics.observe_stage('evaluate', time.time() - start_time)
+                for _, _, eval_tokens in results:
+                    metrics.count_tokens(MODEL_NAME, 'eval_prompt', eval_tokens['prompt_tokens'])
+                    metrics.count_tokens(MODEL_NAME, 'eval_completion', eval_tokens['completion_tokens'])
+                print_log(f'Evaluated {len(batch)} conversation(s), queue size: {self.queue.qsize()}')
+            except Exception as e:
+                print_log(f'!! evaluation failed for {len(batch)} conversation(s): {e}')
+                try:
+                    save_evaluations([
+                        (conversation_id, 'UNKNOWN', f'Evaluation failed. {e}',
+                         {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0})
+                        for conversation_id, _, _ in batch
+                    ])
+                except Exception as save_error:
+                    print_log(f'!! saving failed evaluations: {save_error}')
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+metrics.register_gauge("rag_evaluation_queue_size", "Conversations waiting for relevance evaluation",
+                       lambda: _worker.queue.qsize() if _worker is not None else 0)
+
+
+def submit_evaluation(conversation_id, question, answer):
+    # one worker per process, Streamlit reruns share it
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = EvaluationWorker()
+    return _worker.submit(conversation_id, question, answer)
@@ -1,19 +1,23 @@
 import os
+import re
+import time
+import hashlib
 from glob import glob
 import pandas as pd
 from dotenv import load_dotenv
 
 try:
-    from sentence_transformers import SentenceTransformer
-    from elasticsearch import Elasticsearch
+    from elasticsearch import Elasticsearch, helpers
 except:
     pass
 
+# before embedding_cache, it reads EMBEDDING_CACHE* settings at import
+load_dotenv()
+
 import minsearch
+from embedding_cache import EMBEDDING_CACHE, encode_cached
 
 
-load_dotenv()
-
 DEBUG = False
 
 USE_ELASTIC = os.getenv("USE_ELASTIC")
@@ -21,6 +25,27 @@ ELASTIC_URL = os.getenv("ELASTIC_URL") # ELASTIC_URL_LOCAL
 INDEX_MODEL_NAME = os.getenv("INDEX_MODEL_NAME", "multi-qa-MiniLM-L6-cos-v1")
 INDEX_NAME = os.getenv("INDEX_NAME")
 DATA_PATH = os.getenv("DATA_PATH", "data")
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+# minsearch index snapshot, memory-mapped on start instead of refitting
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "data/minsearch-index")
+VECTOR_INDEX_SNAPSHOT_PATH = os.getenv("VECTOR_INDEX_SNAPSHOT_PATH", "data/minsearch-vector-index")
+# storage of vectors in minsearch.VectorIndex: float32, float16 or int8
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# flat (exact) or ivf (approximate, for large knowledge bases), IVF_NPROBE partitions scanned per query
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# HNSW graph of the ES dense_vector field: hnsw (float32) or int8_hnsw (4x less memory, ES 8.12+),
+# empty keeps the ES default
+VECTOR_INDEX_OPTIONS = os.getenv("VECTOR_INDEX_OPTIONS", "")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+# sync only changed rows into the existing index instead of drop-and-rebuild
+INDEX_INCREMENTAL = os.getenv("INDEX_INCREMENTAL")
+# INDEX_NAME is an alias to the live versioned index, previous versions kept for rollback
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "1"))
+# minsearch index fields, part of the snapshot fingerprint: a snapshot of other fields is refitted
+TEXT_FIELDS = ["question", "text", "section"]
+KEYWORD_FIELDS = ["position", "id"]
 BASE_URL = "https://github.com/dmytrovoytko/llm-interview-assistant/blob/main"
 
 def fetch_documents(data_path=DATA_PATH):
@@ -43,20 +68,64 @@ def fetch_documents(data_path=DATA_PATH):
     return documents
 
 
-def load_index(data_path=DATA_PATH):
+def data_fingerprint(data_path=DATA_PATH):
+    # changes whenever a qna-*.csv file is added, removed or modified
+    data_path = data_path.rstrip('/')
+    stats = [(file_name, os.path.getsize(file_name), os.path.getmtime(file_name))
+             for file_name in sorted(glob(data_path+'/qna-*.csv'))]
+    return hashlib.sha256(repr(stats).encode("utf-8")).hexdigest()
+
+
+def load_index(data_path=DATA_PATH, snapshot_path=INDEX_SNAPSHOT_PATH):
+    fingerprint = f"{data_fingerprint(data_path)}:{TEXT_FIELDS}:{KEYWORD_FIELDS}"
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            index = minsearch.Index.load(snapshot_path, mmap=True)
+            if index.metadata.get("data_fingerprint") == fingerprint:
+                print(f"Loaded minsearch index snapshot {snapshot_path}")
+                return index
+            print(f"Minsearch index snapshot {snapshot_path} is outdated, refitting")
+        except Exception as e:
+            print(f'!! loading minsearch index snapshot {snapshot_path} failed:', e)
+
     documents = fetch_documents(data_path)
 
-    index = minsearch.Index(
-        text_fields=[
-            "question",
-            "text",
-            "position",
-            "section",
-        ],
-        keyword_fields=["id"],
-    )
+    index = minsearch.Index(text_fields=TEXT_FIELDS, keyword_fields=KEYWORD_FIELDS)
 
     index.fit(documents)
+    if snapshot_path:
+        index.save(snapshot_path, metadata={"data_fingerprint": fingerprint})
+        print(f"Saved minsearch index snapshot {snapshot_path}")
+    return index
+
+
+def load_vector_index(data_path=DATA_PATH, snapshot_path=VECTOR_INDEX_SNAPSHOT_PATH):
+    fingerprint = (f"{data_fingerprint(data_path)}:{KEYWORD_FIELDS}:"
+                   f"{INDEX_MODEL_NAME}:{VECTOR_INDEX_DTYPE}:{VECTOR_INDEX_TYPE}")
+    index_class = minsearch.IVFVectorIndex if VECTOR_INDEX_TYPE == "ivf" else minsearch.VectorIndex
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            index = index_class.load(snapshot_path, mmap=True)
+            if index.metadata.get("data_fingerprint") == fingerprint:
+                print(f"Loaded minsearch vector index snapshot {snapshot_path}")
+                if VECTOR_INDEX_TYPE == "ivf":
+                    index.nprobe = IVF_NPROBE
+                return index
+            print(f"Minsearch vector index snapshot {snapshot_path} is outdated, rebuilding")
+        except Exception as e:
+            print(f'!! loading minsearch vector index snapshot {snapshot_path} failed:', e)
+
+    documents = fetch_documents(data_path)
+    vectors = encode_texts([document_text(doc) for doc in documents])
+
+    if VECTOR_INDEX_TYPE == "ivf":
+        index = minsearch.IVFVectorIndex(keyword_fields=KEYWORD_FIELDS, dtype=VECTOR_INDEX_DTYPE, nprobe=IVF_NPROBE)
+    else:
+        index = minsearch.VectorIndex(keyword_fields=KEYWORD_FIELDS, dtype=VECTOR_INDEX_DTYPE)
+    index.fit(vectors, documents)
+    if snapshot_path:
+        index.save(snapshot_path, metadata={"data_fingerprint": fingerprint})
+        print(f"Saved minsearch vector index snapshot {snapshot_path}")
     return index
 
 
@@ -64,9 +133,33 @@ def setup_elasticsearch():
     print(f"Setting up Elasticsearch ({ELASTIC_URL})...")
     es_client = Elasticsearch(ELASTIC_URL)
     print(" Connected to Elasticsearch:", es_client.info())
+    return es_client
+
+
+def new_index_version():
+    return f"{INDEX_NAME}-{time.strftime('%Y%m%d%H%M%S')}"
 
+
+def vector_field_mapping():
+    mapping = {
+        "type": "dense_vector",
+        "dims": 384,
+        "index": True,
+        "similarity": "cosine",
+    }
+    if VECTOR_INDEX_OPTIONS:
+        mapping["index_options"] = {
+            "type": VECTOR_INDEX_OPTIONS,
+            "m": HNSW_M,
+            "ef_construction": HNSW_EF_CONSTRUCTION,
+        }
+    return mapping
+
+
+def create_index(es_client, index_name):
     index_settings = {
-        "settings": {"number_of_shards": 1, "number_of_replicas": 0},
+        # no refreshes while building, warm_index() enables them before the alias swap
+        "settings": {"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": "-1"},
         "mappings": {
             "properties": {
                 "question": {"type": "text"},
@@ -74,38 +167,159 @@ def setup_elasticsearch():
                 "interview": {"type": "keyword"},
                 "section": {"type": "text"},
                 "id": {"type": "keyword"},
-                "question_text_vector": {
-                    "type": "dense_vector",
-                    "dims": 384,
-                    "index": True,
-                    "similarity": "cosine",
-                },
+                "content_hash": {"type": "keyword", "index": False},
+                "question_text_vector": vector_field_mapping(),
             }
         },
     }
 
-    try:
-        es_client.indices.delete(index=INDEX_NAME, ignore_unavailable=True)
-    except Exception as e:
-        print('!! es_client.indices.delete:', e)
-    es_client.indices.create(index=INDEX_NAME, body=index_settings)
-    print(f"Elasticsearch index '{INDEX_NAME}' created")
-    return es_client
+    es_client.indices.create(index=index_name, body=index_settings)
+    print(f"Elasticsearch index '{index_name}' created")
+
+
+def warm_index(es_client, index_name, documents):
+    print(f"Warming up index '{index_name}'...")
+    es_client.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": None}})
+    es_client.indices.forcemerge(index=index_name, max_num_segments=1)
+    es_client.indices.refresh(index=index_name)
+    # load postings and the HNSW graph before live queries hit the index
+    for doc in documents[:5]:
+        es_client.search(index=index_name, body={
+            "size": 3,
+            "query": {"multi_match": {"query": doc["question"], "fields": ["question^3", "text", "section"]}},
+        })
+        es_client.search(index=index_name, body={
+            "knn": {"field": "question_text_vector", "query_vector": doc["question_text_vector"], "k": 3, "num_candidates": 100},
+            "_source": ["id"],
+        })
+
+
+def index_versions(es_client):
+    # only indices created by new_index_version(), not e.g. the benchmark index
+    pattern = re.compile(re.escape(INDEX_NAME) + r"-\d{14}$")
+    indices = es_client.indices.get(index=f"{INDEX_NAME}-*", ignore_unavailable=True, allow_no_indices=True)
+    return sorted(name for name in indices if pattern.match(name))
+
+
+def swap_alias(es_client, index_name):
+    actions = []
+    if es_client.indices.exists_alias(name=INDEX_NAME):
+        for old_index in es_client.indices.get_alias(name=INDEX_NAME):
+            actions.append({"remove": {"index": old_index, "alias": INDEX_NAME}})
+    elif es_client.indices.exists(index=INDEX_NAME):
+        # legacy concrete index with the alias name, replaced in the same atomic call
+        actions.append({"remove_index": {"index": INDEX_NAME}})
+    actions.append({"add": {"index": index_name, "alias": INDEX_NAME}})
+    es_client.indices.update_aliases(actions=actions)
+    print(f"Alias '{INDEX_NAME}' now points to '{index_name}'")
+
+
+def cleanup_index_versions(es_client, keep=INDEX_KEEP_VERSIONS):
+    live = set(es_client.indices.get_alias(name=INDEX_NAME)) if es_client.indices.exists_alias(name=INDEX_NAME) else set()
+    old_versions = [name for name in index_versions(es_client) if name not in live]
+    stale = old_versions[:max(len(old_versions) - keep, 0)]
+    for index_name in stale:
+        es_client.indices.delete(index=index_name, ignore_unavailable=True)
+        print(f" Deleted old index version '{index_name}'")
 
 
 def load_model():
+    # imported here, torch takes seconds to import and snapshot/cached runs don't need it
+    from sentence_transformers import SentenceTransformer
     print(f"Loading model: {INDEX_MODEL_NAME}")
     return SentenceTransformer(INDEX_MODEL_NAME)
 
 
-def index_documents(es_client, documents, model):
-    print("Indexing documents...")
-    for doc in documents:
-        question = doc["question"]
-        text = doc["text"]
-        doc["question_text_vector"] = model.encode(question + " " + text).tolist()
-        es_client.index(index=INDEX_NAME, document=doc)
-    print(f" Indexed {len(documents)} documents")
+_model = None
+
+
+def get_model():
+    # loaded on the first embedding cache miss only
+    global _model
+    if _model is None:
+        _model = load_model()
+    return _model
+
+
+def encode_texts(texts, model=None, batch_size=INDEX_BATCH_SIZE, use_cache=EMBEDDING_CACHE):
+    def encode_fn(missing_texts):
+        return (model or get_model()).encode(missing_texts, batch_size=batch_size)
+
+    return encode_cached(INDEX_MODEL_NAME, texts, encode_fn, use_cache=use_cache)
+
+
+def document_text(doc):
+    return doc["question"] + " " + doc["text"]
+
+
+def content_hash(doc):
+    # model name is part of the hash so switching INDEX_MODEL_NAME re-embeds everything
+    content = "\x1f".join(
+        str(value) for value in (INDEX_MODEL_NAME, doc["question"], doc["text"], doc["section"], doc["position"])
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def generate_actions(documents, model=None, batch_size=INDEX_BATCH_SIZE, index_name=INDEX_NAME, use_cache=EMBEDDING_CACHE):
+    # one encode() call per batch instead of per document, cached vectors are not re-encoded
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        vectors = encode_texts([document_text(doc) for doc in batch], model, batch_size=batch_size, use_cache=use_cache)
+        for doc, vector in zip(batch, vectors):
+            doc["question_text_vector"] = vector.tolist()
+            doc["content_hash"] = content_hash(doc)
+            # CSV id as _id: re-indexing a row overwrites it instead of adding a duplicate
+            yield {"_index": index_name, "_id": doc["id"], "_source": doc}
+
+
+def index_documents(es_client, documents, model=None, batch_size=INDEX_BATCH_SIZE, index_name=INDEX_NAME):
+    print(f"Indexing documents into '{index_name}' (batch size {batch_size})...")
+    start_time = time.time()
+    indexed, errors = 0, 0
+    actions = generate_actions(documents, model, batch_size=batch_size, index_name=index_name)
+    for ok, info in helpers.streaming_bulk(es_client, actions, chunk_size=batch_size, raise_on_error=False):
+        if ok:
+            indexed += 1
+        else:
+            errors += 1
+            print('!! bulk indexing failed:', info)
+    # refresh once at the end instead of relying on per-document visibility
+    es_client.indices.refresh(index=index_name)
+    elapsed = time.time() - start_time
+    print(f" Indexed {indexed} documents in {elapsed:.2f}s ({indexed / max(elapsed, 1e-9):.1f} docs/sec), {errors} error(s)")
+    return indexed
+
+
+def fetch_indexed_hashes(es_client, index_name=INDEX_NAME):
+    hits = helpers.scan(es_client, index=index_name, query={"query": {"match_all": {}}}, _source=["content_hash"])
+    return {hit["_id"]: hit["_source"].get("content_hash") for hit in hits}
+
+
+def sync_documents(es_client, documents, batch_size=INDEX_BATCH_SIZE):
+    print("Syncing documents incrementally...")
+    start_time = time.time()
+    indexed_hashes = fetch_indexed_hashes(es_client)
+    changed = [doc for doc in documents if indexed_hashes.get(doc["id"]) != content_hash(doc)]
+    current_ids = {doc["id"] for doc in documents}
+    removed = [doc_id for doc_id in indexed_hashes if doc_id not in current_ids]
+    print(f" {len(documents)} document(s): {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(documents) - len(changed)} unchanged")
+
+    if changed:
+        index_documents(es_client, changed, batch_size=batch_size)
+    if removed:
+        actions = ({"_op_type": "delete", "_index": INDEX_NAME, "_id": doc_id} for doc_id in removed)
+        errors = 0
+        for ok, info in helpers.streaming_bulk(es_client, actions, chunk_size=batch_size, raise_on_error=False):
+            # a document that's already gone is what the delete was for
+            if not ok and info.get("delete", {}).get("status") != 404:
+                errors += 1
+                print('!! bulk delete failed:', info)
+        es_client.indices.refresh(index=INDEX_NAME)
+        if errors:
+            raise RuntimeError(f"{errors} of {len(removed)} removed document(s) could not be deleted from {INDEX_NAME}")
+    print(f" Sync completed in {time.time() - start_time:.2f}s")
+    return len(changed), len(removed)
 
 
 def init_elasticsearch():
@@ -114,9 +328,17 @@ def init_elasticsearch():
     print("ElasticSearch: starting the indexing process...")
 
     documents = fetch_documents()
-    model = load_model()
     es_client = setup_elasticsearch()
-    index_documents(es_client, documents, model)
+    if INDEX_INCREMENTAL and es_client.indices.exists(index=INDEX_NAME):
+        sync_documents(es_client, documents)
+    else:
+        # build a new version next to the live one, then switch the alias atomically
+        index_name = new_index_version()
+        create_index(es_client, index_name)
+        index_documents(es_client, documents, index_name=index_name)
+        warm_index(es_client, index_name, documents)
+        swap_alias(es_client, index_name)
+        cleanup_index_versions(es_client)
     # you may consider to comment <end>
 
     # print("Initializing database...")
@@ -125,63 +347,20 @@ def init_elasticsearch():
     print(" Indexing process completed successfully!")
     return es_client
 
-SEARCH_RESULTS_NUM = 3 # 5
-
-def elastic_search_text(query, position, index_name=INDEX_NAME):
-    search_query = {
-        "size": SEARCH_RESULTS_NUM,
-        "query": {
-            "bool": {
-                "must": {
-                    "multi_match": {
-                        "query": query,
-                        "fields": ["question^3", "text", "section"],
-                        "type": "best_fields",
-                    }
-                },
-                "filter": {"term": {"position": position}},
-            }
-        },
-    }
-
-    response = es_client.search(index=index_name, body=search_query)
-    # variant with scores
-    # return [(hit["_source"], hit["_score"]) for hit in response["hits"]["hits"]]
-    return [hit["_source"] for hit in response["hits"]["hits"]]
-
-
-def elastic_search_knn(field, vector, position, index_name=INDEX_NAME):
-    knn = {
-        "field": field,
-        "query_vector": vector,
-        "k": SEARCH_RESULTS_NUM,
-        "num_candidates": 10000,
-        "filter": {"term": {"position": position}},
-    }
-
-    search_query = {
-        "knn": knn,
-        "_source": ["text", "section", "question", "position", "id"],
-    }
-
-    response = es_client.search(index=index_name, body=search_query)
-
-    return [hit["_source"] for hit in response["hits"]["hits"]]
-
 
 if __name__ == "__main__":
     if USE_ELASTIC: 
         es_client = init_elasticsearch()
 
         if DEBUG:
-            # quick test
+            # quick test with the app's search settings (KNN_NUM_CANDIDATES, SEARCH_SOURCE_FIELDS)
+            from app_rag import elastic_search_knn, elastic_search_text
             position = 'de'
             query = 'What is Data Engineering?'
             print('\nTest query:', query)
             for search_type in ['Text', 'Vector']: 
                 if search_type == 'Vector':
-                    index_model = load_model()
-                    vector = index_model.encode(query)
+                    vector = encode_texts([query])[0]
                     search_results = elastic_search_knn('question_text_vector', vector, position)
                 else:
                     search_results = elastic_search_text(query, position)
@@ -190,6 +369,8 @@ if __name__ == "__main__":
         print("MinSearch: Ingesting data...")
         index = load_index(data_path=DATA_PATH)
         print(f' Indexed {len(index.docs)} document(s)')
+        vector_index = load_vector_index(data_path=DATA_PATH)
+        print(f' Indexed {len(vector_index.docs)} document vector(s)')
 
         if DEBUG:
             # quick test
@@ -198,3 +379,5 @@ if __name__ == "__main__":
             print('\nTest query:', query)
             search_results = index.search(query, {'position': position}, num_results=3)
             print(len(search_results), search_results)    
+            search_results = vector_index.search(encode_texts([query])[0], {'position': position}, num_results=3)
+            print(len(search_results), search_results)
@@ -19,6 +19,8 @@ PG_USER = os.getenv("POSTGRES_USER")
 PG_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 PG_PORT = os.getenv("POSTGRES_PORT")
 
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus:9090")
+
 
 def create_api_key():
     auth = (GRAFANA_USER, GRAFANA_PASSWORD)
@@ -57,12 +59,8 @@ def create_api_key():
         return None
 
 
-def create_or_update_datasource(api_key):
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    datasource_payload = {
+def postgres_datasource():
+    return {
         "name": "PostgreSQL",
         "type": "postgres",
         "url": f"{PG_HOST}:{PG_PORT}",
@@ -75,6 +73,26 @@ def create_or_update_datasource(api_key):
         "secureJsonData": {"password": PG_PASSWORD},
     }
 
+
+def prometheus_datasource():
+    # live metrics of the app (metrics.py), dashboard panels use PostgreSQL
+    return {
+        "name": "Prometheus",
+        "type": "prometheus",
+        "url": PROMETHEUS_URL,
+        "access": "proxy",
+        "basicAuth": False,
+        "isDefault": False,
+        "jsonData": {"httpMethod": "POST", "timeInterval": "15s"},
+    }
+
+
+def create_or_update_datasource(api_key, datasource_payload):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
     print("Datasource payload:")
     print(json.dumps(datasource_payload, indent=2))
 
@@ -184,11 +202,14 @@ def main():
         print("API key creation failed")
         return
 
-    datasource_uid = create_or_update_datasource(api_key)
+    datasource_uid = create_or_update_datasource(api_key, postgres_datasource())
     if not datasource_uid:
         print("Datasource creation failed")
         return
 
+    if not create_or_update_datasource(api_key, prometheus_datasource()):
+        print("Prometheus datasource creation failed")
+
     create_dashboard(api_key, datasource_uid)
 
 
@@ -0,0 +1,364 @@
+import os
+import time
+import queue
+import random
+import asyncio
+import threading
+
+from context_packing import count_tokens
+
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434/v1/")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-api-key-here")
+# seconds per attempt: whole completion, or between streamed chunks. CPU Ollama is slow, OpenAI isn't
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+# per model overrides: "ollama/phi3.5=180,openai/gpt-4o=60"
+LLM_TIMEOUTS = os.getenv("LLM_TIMEOUTS", "")
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))  # seconds, doubled each retry, full jitter
+# models to try when a model fails: "ollama/phi3.5=openai/gpt-4o-mini,*=openai/gpt-4o-mini"
+LLM_FAILOVER = os.getenv("LLM_FAILOVER", "")
+# a backend failing that many times in a row is skipped for LLM_CIRCUIT_RESET seconds
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_RESET = float(os.getenv("LLM_CIRCUIT_RESET", "30"))
+
+
+def parse_mapping(value):
+    mapping = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, target = item.split("=", 1)
+            mapping[key.strip()] = target.strip()
+    return mapping
+
+
+MODEL_TIMEOUTS = {model: float(timeout) for model, timeout in parse_mapping(LLM_TIMEOUTS).items()}
+FAILOVER_MODELS = parse_mapping(LLM_FAILOVER)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Consecutive failure counter of a backend: after max_failures it opens and calls are refused
+    for reset_time seconds, then one trial call is let through (half-open), its result closes
+    or reopens the circuit.
+    """
+
+    def __init__(self, name, max_failures=LLM_CIRCUIT_FAILURES, reset_time=LLM_CIRCUIT_RESET):
+        self.name = name
+        self.max_failures = max_failures
+        self.reset_time = reset_time
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.trial or time.time() - self.opened_at >= self.reset_time:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.time() - self.opened_at >= self.reset_time:
+                self.trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def release(self):
+        # a call that didn't show whether the backend is healthy (cancelled, client error), the next one may try
+        with self.lock:
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.max_failures:
+                print(f"!! {self.name} circuit opened after {self.failures} failure(s)", flush=True)
+                self.opened_at = time.time()
+                self.trial = False
+
+
+class LLMBackend:
+    """
+    An OpenAI-compatible chat completion endpoint (Ollama or OpenAI) called with AsyncOpenAI,
+    with a per-attempt timeout and a circuit breaker.
+    """
+
+    def __init__(self, name, base_url=None, api_key=None, timeout=60):
+        from openai import AsyncOpenAI
+        self.name = name
+        self.timeout = timeout
+        # retries are done here, with failover between backends
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+        self.breaker = CircuitBreaker(name)
+
+    def model_timeout(self, model_choice):
+        return MODEL_TIMEOUTS.get(model_choice, self.timeout)
+
+    async def complete(self, model_choice, prompt, max_tokens=None):
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=model_choice.split('/')[-1],
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+            ),
+            timeout=self.model_timeout(model_choice),
+        )
+        tokens = {
+            'prompt_tokens': response.usage.prompt_tokens,
+            'completion_tokens': response.usage.completion_tokens,
+            'total_tokens': response.usage.total_tokens
+        }
+        return response.choices[0].message.content, tokens
+
+    async def stream(self, model_choice, prompt, max_tokens=None):
+        # yields (text, usage), the timeout applies to the wait for each chunk
+        timeout = self.model_timeout(model_choice)
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=model_choice.split('/')[-1],
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            ),
+            timeout=timeout,
+        )
+        chunks = response.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                yield text, chunk.usage
+        finally:
+            await response.close()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+_loop = None
+
+
+def get_backend(model_choice):
+    if model_choice.startswith('ollama/'):
+        name, kwargs = 'ollama', dict(base_url=OLLAMA_URL, api_key="ollama", timeout=OLLAMA_TIMEOUT)
+    elif model_choice.startswith('openai/'):
+        name, kwargs = 'openai', dict(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT)
+    else:
+        raise ValueError(f"Unknown model choice: {model_choice}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = LLMBackend(name, **kwargs)
+        return _backends[name]
+
+
+def get_loop():
+    # one event loop thread per process runs all LLM calls, Streamlit threads wait for their results
+    global _loop
+    with _backends_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+
+def failover_chain(model_choice):
+    chain = [model_choice]
+    while True:
+        next_model = FAILOVER_MODELS.get(chain[-1], FAILOVER_MODELS.get("*"))
+        if not next_model or next_model in chain:
+            return chain
+        chain.append(next_model)
+
+
+def is_retryable(error):
+    import openai
+    return isinstance(error, (
+        asyncio.TimeoutError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    ))
+
+
+def backoff(attempt):
+    return random.uniform(0, LLM_RETRY_BACKOFF * 2 ** attempt)
+
+
+async def complete_async(prompt, model_choice, max_tokens=None):
+    # retries of each model of the failover chain, backends with an open circuit are skipped
+    last_error = CircuitOpenError(f"no available backend for {model_choice}")
+    for model in failover_chain(model_choice):
+        backend = get_backend(model)
+        for attempt in range(LLM_RETRIES + 1):
+            if not backend.breaker.allow():
+                print(f"!! {backend.name} circuit is open, skipping {model}", flush=True)
+                break
+            try:
+                answer, tokens = await backend.complete(model, prompt, max_tokens)
+                backend.breaker.record_success()
+                return answer, tokens, model
+            except asyncio.CancelledError:
+                backend.breaker.release()
+                raise
+            except Exception as e:
+                last_error = e
+                print(f"!! {model} attempt {attempt + 1} failed: {e!r}", flush=True)
+                if not is_retryable(e):
+                    # 4xx won't get better on retry, try the next model. The backend is up, not a circuit failure
+                    backend.breaker.release()
+                    break
+                backend.breaker.record_failure()
+                if attempt < LLM_RETRIES:
+                    await asyncio.sleep(backoff(attempt))
+    raise last_error
+
+
+def complete(prompt, model_choice, max_tokens=None):
+    """Returns (answer, tokens, model used), blocking the calling thread."""
+    return asyncio.run_coroutine_threadsafe(complete_async(prompt, model_choice, max_tokens), get_loop()).result()
+
+
+def complete_many(requests):
+    """
+    Runs several (prompt, model_choice, max_tokens) completions concurrently.
+    Returns a list of (answer, tokens, model used) or the exception raised, in the same order.
+    """
+    async def gather():
+        return await asyncio.gather(
+            *(complete_async(prompt, model_choice, max_tokens) for prompt, model_choice, max_tokens in requests),
+            return_exceptions=True,
+        )
+    return asyncio.run_coroutine_threadsafe(gather(), get_loop()).result()
+
+
+async def _stream_to_queue(prompt, model_choice, max_tokens, chunks):
+    # like complete_async(), but only until the first chunk is out
+    last_error = CircuitOpenError(f"no available backend for {model_choice}")
+    for model in failover_chain(model_choice):
+        backend = get_backend(model)
+        for attempt in range(LLM_RETRIES + 1):
+            if not backend.breaker.allow():
+                print(f"!! {backend.name} circuit is open, skipping {model}", flush=True)
+                break
+            started = False
+            usage = None
+            try:
+                async for text, chunk_usage in backend.stream(model, prompt, max_tokens):
+                    if chunk_usage:
+                        usage = chunk_usage
+                    if text:
+                        started = True
+                        chunks.put(("chunk", text))
+                backend.breaker.record_success()
+                chunks.put(("done", (model, usage)))
+                return
+            except asyncio.CancelledError:
+                # the reader stopped early (stream() cancels this coroutine)
+                backend.breaker.release()
+                raise
+            except Exception as e:
+                last_error = e
+                print(f"!! {model} stream attempt {attempt + 1} failed: {e!r}", flush=True)
+                retryable = is_retryable(e)
+                if retryable:
+                    backend.breaker.record_failure()
+                else:
+                    backend.breaker.release()
+                if started:
+                    # part of the answer is already shown, it can't be replaced by another one
+                    chunks.put(("error", e))
+                    return
+                if not retryable:
+                    break
+                if attempt < LLM_RETRIES:
+                    await asyncio.sleep(backoff(attempt))
+    chunks.put(("error", last_error))
+
+
+async def _stream_to_queue_safe(prompt, model_choice, max_tokens, chunks):
+    # the reader waits on the queue, any error (like a backend that can't be created) must end up there
+    try:
+        await _stream_to_queue(prompt, model_choice, max_tokens, chunks)
+    except Exception as e:
+        chunks.put(("error", e))
+
+
+def stream(prompt, model_choice, max_tokens=None, stats=None):
+    """
+    Yields answer chunks, retrying or failing over until the first chunk arrives. Once exhausted,
+    fills stats with answer, tokens, response_time, first_token_time and model_used.
+    """
+    start_time = time.time()
+    chunks = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(_stream_to_queue_safe(prompt, model_choice, max_tokens, chunks),
+                                              get_loop())
+    answer_chunks = []
+    first_token_time = None
+    try:
+        while True:
+            kind, value = chunks.get()
+            if kind == "chunk":
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                answer_chunks.append(value)
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                model_used, usage = value
+                break
+    finally:
+        # the reader stopped early, don't keep generating
+        future.cancel()
+
+    if usage:
+        tokens = {
+            'prompt_tokens': usage.prompt_tokens,
+            'completion_tokens': usage.completion_tokens,
+            'total_tokens': usage.total_tokens
+        }
+    else:
+        # server didn't send usage: local tokenizer for the prompt, one token per streamed chunk
+        prompt_tokens = count_tokens(prompt)
+        tokens = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(answer_chunks),
+            'total_tokens': prompt_tokens + len(answer_chunks)
+        }
+
+    if stats is not None:
+        response_time = time.time() - start_time
+        stats.update({
+            'answer': "".join(answer_chunks),
+            'tokens': tokens,
+            'response_time': response_time,
+            'first_token_time': first_token_time if first_token_time is not None else response_time,
+            'model_used': model_used,
+        })
+
+
+def backend_stats():
+    with _backends_lock:
+        return {name: {'state': backend.breaker.state, 'failures': backend.breaker.failures}
+                for name, backend in _backends.items()}
@@ -0,0 +1,258 @@
+"""
+Load test of the RAG pipeline: drives app_rag.get_answer_stream (and the conversation save and evaluation
+submit app.py does afterwards with --save-db) at a fixed concurrency or request rate, reports throughput,
+error rates and p50/p95/p99 latency of each pipeline stage, and saves them to a JSON report.
+
+With --mock an in-process mock_llm_server.py answers Ollama and OpenAI calls, with minsearch as
+the search backend (default) nothing needs network or running containers.
+
+Stages (seconds), embed to evaluate are answer_data['timings'] of app_rag:
+    queue        waiting for a free worker (--rps only, latency is counted from the scheduled start)
+    embed        query encoding (vector search, semantic answer cache)
+    search       text/vector/hybrid search
+    rerank       cross-encoder reranking (RERANK_ENABLED=1)
+    build_prompt context packing and prompt formatting
+    first_token  request start to the first answer chunk
+    generate     LLM call
+    evaluate     relevance evaluation (EVAL_ASYNC=0)
+    answer       request start to the complete answer
+    save         save_conversation() (--save-db)
+    total        request start to done
+
+Usage:
+    python loadtest.py --mock --concurrency 16 --requests 500
+    python loadtest.py --mock --rps 20 --duration 60 --mock-token-latency 0.05
+    python loadtest.py --model openai/gpt-4o-mini --search-backend elasticsearch --concurrency 4 --save-db
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+GROUND_TRUTH_PATH = "../notebooks/ground-truth-data.csv"
+REPORT_PATH = "loadtest-report.json"
+POSITIONS = {"de": "data engineer", "mle": "machine learning engineer"}
+STAGES = ["queue", "embed", "search", "rerank", "build_prompt", "first_token", "generate", "evaluate", "answer",
+          "save", "total"]
+
+
+def load_questions(path=GROUND_TRUTH_PATH):
+    df = pd.read_csv(path)
+    return [(q, POSITIONS.get(p, "data engineer")) for q, p in zip(df["question"], df["position"])]
+
+
+class LoadTest:
+    """
+    Runs requests with a thread pool: closed loop (each of concurrency workers sends its next request
+    when the previous one is done) or open loop at rps requests per second.
+    """
+
+    def __init__(self, questions, args):
+        import app_rag
+        self.app_rag = app_rag
+        self.questions = questions
+        self.args = args
+        self.results = []
+        self.lock = threading.Lock()
+        self.next_request = 0
+        self.errors_printed = 0
+        self.save_conversation = self.submit_evaluation = None
+        if args.save_db:
+            from db import save_conversation
+            from evaluation_worker import submit_evaluation
+            self.save_conversation, self.submit_evaluation = save_conversation, submit_evaluation
+
+    def take_request(self, deadline):
+        with self.lock:
+            if self.next_request >= self.args.requests or time.time() >= deadline:
+                return None
+            self.next_request += 1
+            return self.next_request - 1
+
+    def run_request(self, i, scheduled_time=None):
+        start_time = time.time()
+        question, position_choice = self.questions[i % len(self.questions)]
+        if self.args.unique:
+            # defeats the answer cache and request coalescing
+            question = f"{question} ({i})"
+        if scheduled_time is None:
+            scheduled_time = start_time
+        stages = {"queue": start_time - scheduled_time}
+        result = {"ok": False, "error": None, "cache_hit": False, "coalesced": False, "stages": stages}
+        try:
+            answer_data = {}
+            first_chunk_time = None
+            for _ in self.app_rag.get_answer_stream(question, position_choice, self.args.model, self.args.search_type,
+                                                    self.args.response_length, answer_data):
+                if first_chunk_time is None:
+                    first_chunk_time = time.time()
+            answer_time = time.time()
+            first_chunk_time = first_chunk_time or answer_time
+            stages["first_token"] = first_chunk_time - scheduled_time
+            stages["answer"] = answer_time - scheduled_time
+            result["cache_hit"] = bool(answer_data.get("cache_hit"))
+            result["coalesced"] = bool(answer_data.get("coalesced"))
+            # stages this request went through, its total is answer here
+            stages.update({stage: seconds for stage, seconds in answer_data["timings"].items() if stage != "total"})
+
+            if self.save_conversation is not None:
+                save_start = time.time()
+                conversation_id = f"loadtest-{self.args.run_id}-{i}"
+                self.save_conversation(conversation_id, question, answer_data, position_choice)
+                if answer_data["relevance"] == "PENDING":
+                    self.submit_evaluation(conversation_id, question, answer_data["answer"])
+                stages["save"] = time.time() - save_start
+            result["ok"] = True
+        except Exception as e:
+            result["error"] = type(e).__name__
+            with self.lock:
+                self.errors_printed += 1
+                print_error = self.errors_printed <= 3
+            if print_error:
+                print(f"!! request {i} failed: {e!r}", flush=True)
+        stages["total"] = time.time() - scheduled_time
+        with self.lock:
+            self.results.append(result)
+
+    def closed_loop_worker(self, deadline):
+        while True:
+            i = self.take_request(deadline)
+            if i is None:
+                return
+            self.run_request(i)
+
+    def run(self):
+        deadline = time.time() + self.args.duration if self.args.duration else float("inf")
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency, thread_name_prefix="loadtest") as pool:
+            if self.args.rps:
+                # open loop: requests start on schedule whether or not earlier ones are done
+                while True:
+                    i = self.take_request(deadline)
+                    if i is None:
+                        break
+                    scheduled_time = start_time + i / self.args.rps
+                    time.sleep(max(scheduled_time - time.time(), 0))
+                    pool.submit(self.run_request, i, scheduled_time)
+            else:
+                for _ in range(self.args.concurrency):
+                    pool.submit(self.closed_loop_worker, deadline)
+        return time.time() - start_time
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "mean": float(np.mean(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(np.max(values)),
+    }
+
+
+def summarize(results, wall_time):
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "errors": errors,
+        "cache_hits": sum(r["cache_hit"] for r in ok),
+        "coalesced": sum(r["coalesced"] for r in ok),
+        "wall_time": wall_time,
+        "throughput_rps": len(ok) / wall_time if wall_time else 0.0,
+        # milliseconds, over successful requests
+        "stages_ms": {stage: percentiles([r["stages"][stage] for r in ok if stage in r["stages"]])
+                      for stage in STAGES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the RAG pipeline")
+    parser.add_argument("--concurrency", type=int, default=8, help="worker threads (closed loop) / max in flight")
+    parser.add_argument("--rps", type=float, help="open loop: requests per second")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--duration", type=float, help="seconds, stop earlier than --requests")
+    parser.add_argument("--model", default="ollama/phi3.5")
+    parser.add_argument("--search-type", choices=["Text", "Vector", "Hybrid"], default="Text")
+    parser.add_argument("--response-length", choices=["S", "M", "L"], default="S")
+    parser.add_argument("--search-backend", choices=["minsearch", "elasticsearch"], default="minsearch")
+    parser.add_argument("--unique", action="store_true", help="make every question unique (no cache hits)")
+    parser.add_argument("--save-db", action="store_true", help="save conversations and queue evaluations")
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--output", default=REPORT_PATH, help="JSON report path")
+    parser.add_argument("--mock", action="store_true", help="answer LLM calls with an in-process mock server")
+    parser.add_argument("--mock-first-token-latency", type=float, help="seconds")
+    parser.add_argument("--mock-token-latency", type=float, help="seconds per token")
+    parser.add_argument("--mock-completion-tokens", type=int)
+    parser.add_argument("--mock-error-rate", type=float)
+    args = parser.parse_args()
+    args.run_id = time.strftime("%Y%m%d%H%M%S")
+
+    if args.mock:
+        from mock_llm_server import start_server
+        mock_options = {
+            "first_token_latency": args.mock_first_token_latency,
+            "token_latency": args.mock_token_latency,
+            "completion_tokens": args.mock_completion_tokens,
+            "error_rate": args.mock_error_rate,
+        }
+        _, mock_url = start_server(port=0, **{key: value for key, value in mock_options.items() if value is not None})
+        print(f"Mock LLM server on {mock_url}")
+        # read by llm_backends and the OpenAI client, so set before app_rag is imported
+        os.environ["OLLAMA_URL"] = mock_url
+        os.environ["OPENAI_BASE_URL"] = mock_url
+    os.environ["SEARCH_BACKEND"] = args.search_backend
+
+    questions = load_questions(args.ground_truth)
+    load_test = LoadTest(questions, args)
+    # model loading and index building aren't part of request latency
+    load_test.app_rag._prewarm()
+
+    mode = f"{args.rps} req/s, up to {args.concurrency} in flight" if args.rps else f"concurrency {args.concurrency}"
+    print(f"\nLoad test: {args.requests} request(s), {mode}, {args.model}, {args.search_type} search "
+          f"({args.search_backend}), response length {args.response_length}")
+    wall_time = load_test.run()
+    summary = summarize(load_test.results, wall_time)
+
+    print(f"\n {summary['ok']}/{summary['requests']} ok in {wall_time:.1f}s, {summary['throughput_rps']:.2f} req/s, "
+          f"error rate {summary['error_rate']:.2%} {summary['errors'] or ''}")
+    print(f" cache hits: {summary['cache_hits']}, coalesced: {summary['coalesced']}")
+    print(f"\n {'stage (ms)':<12} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for stage, stats in summary["stages_ms"].items():
+        if stats:
+            print(f" {stage:<12} {stats['count']:>6} {stats['mean']:>9.1f} {stats['p50']:>9.1f} "
+                  f"{stats['p95']:>9.1f} {stats['p99']:>9.1f} {stats['max']:>9.1f}")
+
+    import llm_backends
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key != "run_id"},
+        **summary,
+        "llm_backends": llm_backends.backend_stats(),
+    }
+    if args.save_db:
+        from db import get_pool_stats
+        report["db_pool"] = get_pool_stats()
+        print(f" DB pool: {report['db_pool']}")
+    if args.output:
+        with open(args.output, "wt", encoding="utf-8") as f_out:
+            json.dump(report, f_out, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import threading
+
+
+# Prometheus metrics of the app process on METRICS_PORT (/metrics), prometheus_client is optional
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+# seconds, from search (ms) to CPU Ollama generation (minutes)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_metrics = None
+_metrics_loaded = False
+_gauges = {}
+_server_started = False
+_lock = threading.Lock()
+
+
+class Metrics:
+    """Metric objects of the RAG pipeline, created once per process."""
+
+    def __init__(self, prometheus_client):
+        self.prometheus_client = prometheus_client
+        self.stage_seconds = prometheus_client.Histogram(
+            "rag_stage_seconds", "Time spent in a pipeline stage", ["stage"], buckets=STAGE_BUCKETS,
+        )
+        self.answers = prometheus_client.Counter(
+            "rag_answers_total", "Answers by how they were produced", ["result"],
+        )
+        self.tokens = prometheus_client.Counter(
+            "rag_tokens_total", "LLM tokens by model that answered", ["model_used", "kind"],
+        )
+        self.openai_cost = prometheus_client.Counter(
+            "rag_openai_cost_dollars_total", "OpenAI cost of answers", ["model_used"],
+        )
+        self.search_errors = prometheus_client.Counter(
+            "rag_search_errors_total", "Failed searches", ["backend", "search_type"],
+        )
+
+
+def get_metrics():
+    # None when disabled or prometheus_client isn't installed, all functions below do nothing then
+    global _metrics, _metrics_loaded
+    with _lock:
+        if not _metrics_loaded:
+            if METRICS_ENABLED:
+                try:
+                    import prometheus_client
+                    _metrics = Metrics(prometheus_client)
+                except ImportError as e:
+                    print(f"!! prometheus_client is not available, metrics are disabled: {e}", flush=True)
+            _metrics_loaded = True
+        return _metrics
+
+
+def start_server(port=METRICS_PORT):
+    """Serves /metrics in a background thread, once per process."""
+    global _server_started
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    with _lock:
+        if _server_started:
+            return
+        try:
+            metrics.prometheus_client.start_http_server(port)
+            print(f"Metrics served on port {port}", flush=True)
+        except OSError as e:
+            print(f"!! metrics server failed to start on port {port}: {e}", flush=True)
+        _server_started = True
+
+
+def register_gauge(name, description, fn):
+    """Gauge read from fn() on each scrape, like pool usage or queue size."""
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    with _lock:
+        if name not in _gauges:
+            _gauges[name] = metrics.prometheus_client.Gauge(name, description)
+            _gauges[name].set_function(fn)
+
+
+def observe_stage(stage, seconds):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.stage_seconds.labels(stage).observe(seconds)
+
+
+def count_tokens(model_used, kind, tokens):
+    metrics = get_metrics()
+    if metrics is not None and tokens:
+        metrics.tokens.labels(model_used, kind).inc(tokens)
+
+
+def count_search_error(backend, search_type):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.search_errors.labels(backend, search_type).inc()
+
+
+def observe_answer(answer_data):
+    """Stage timings, tokens and cost of a complete answer (generated, from cache or coalesced)."""
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    if answer_data.get("cache_hit"):
+        result = "cache_hit"
+    elif answer_data.get("coalesced"):
+        result = "coalesced"
+    else:
+        result = "generated"
+    metrics.answers.labels(result).inc()
+    for stage, seconds in answer_data.get("timings", {}).items():
+        metrics.stage_seconds.labels(stage).observe(seconds)
+    model_used = answer_data["model_used"]
+    for kind in ("prompt_tokens", "completion_tokens", "eval_prompt_tokens", "eval_completion_tokens"):
+        count_tokens(model_used, kind[:-len("_tokens")], answer_data.get(kind, 0))
+    if answer_data.get("openai_cost"):
+        metrics.openai_cost.labels(model_used).inc(answer_data["openai_cost"])
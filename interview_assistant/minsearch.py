@@ -1,22 +1,140 @@
+import os
+import json
+import shutil
+
 import pandas as pd
 
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from scipy import sparse
 
 import numpy as np
 
+# max dense scores matrix size (cells) computed at once in search_many
+MAX_SCORE_CELLS = 2 ** 26
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def save_array(path, name, array):
+    np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def load_array(path, name, mmap=True):
+    return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+
+def save_json(path, name, data):
+    with open(os.path.join(path, f"{name}.json"), "wt", encoding="utf-8") as f_out:
+        json.dump(data, f_out, ensure_ascii=False)
+
+
+def load_json(path, name):
+    with open(os.path.join(path, f"{name}.json"), "rt", encoding="utf-8") as f_in:
+        return json.load(f_in)
+
+
+def replace_directory(tmp_path, path):
+    # swap a fully written snapshot in place of the old one
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def factorize_keywords(docs, keyword_fields):
+    """
+    Returns (keyword_codes, keyword_values): an integer code array (one code per document) and
+    a value -> code dictionary for each keyword field.
+    """
+    keyword_codes, keyword_values = {}, {}
+    for field in keyword_fields:
+        codes, uniques = pd.factorize(pd.Series([doc.get(field, "") for doc in docs], dtype=object))
+        keyword_codes[field] = codes.astype(np.int32)
+        keyword_values[field] = {value: code for code, value in enumerate(uniques)}
+    return keyword_codes, keyword_values
+
+
+def filter_codes(keyword_codes, keyword_values, filter_dict):
+    # (codes, code) pairs for filters on keyword fields, code -1 matches nothing
+    return [
+        (keyword_codes[field], keyword_values[field].get(value, -1))
+        for field, value in filter_dict.items()
+        if field in keyword_codes
+    ]
+
+
+def save_keywords(path, keyword_codes, keyword_values):
+    for field, codes in keyword_codes.items():
+        save_array(path, f"keyword_codes_{field}", codes)
+        values = sorted(keyword_values[field], key=keyword_values[field].get)
+        save_json(path, f"keyword_values_{field}", [value.item() if hasattr(value, "item") else value for value in values])
+
+
+def load_keywords(path, keyword_fields, mmap=True):
+    keyword_codes, keyword_values = {}, {}
+    for field in keyword_fields:
+        keyword_codes[field] = load_array(path, f"keyword_codes_{field}", mmap)
+        keyword_values[field] = {value: code for code, value in enumerate(load_json(path, f"keyword_values_{field}"))}
+    return keyword_codes, keyword_values
+
+
+class MappedDocs:
+    """
+    Read-only list of documents stored as JSON lines in a memory-mapped file,
+    a document is parsed when accessed.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.offsets = load_array(path, "docs_offsets", mmap)
+        if mmap:
+            self.data = np.memmap(os.path.join(path, "docs.jsonl"), dtype=np.uint8, mode="r")
+        else:
+            self.data = np.fromfile(os.path.join(path, "docs.jsonl"), dtype=np.uint8)
+
+    @staticmethod
+    def save(path, docs):
+        offsets = [0]
+        with open(os.path.join(path, "docs.jsonl"), "wb") as f_out:
+            for doc in docs:
+                line = json.dumps(doc, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+                f_out.write(line)
+                offsets.append(offsets[-1] + len(line))
+        save_array(path, "docs_offsets", np.array(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(self.data[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
 
 class Index:
     """
     A simple search index using TF-IDF and cosine similarity for text fields and exact matching for keyword fields.
 
+    TF-IDF rows are L2-normalized once at fit time, so cosine similarity is a plain dot product.
+    All text fields are stacked into one term-document matrix (an inverted index), a query touches
+    only postings of its own terms and only documents with a non-zero score are ranked.
+
     Attributes:
         text_fields (list): List of text field names to index.
         keyword_fields (list): List of keyword field names to index.
         vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
-        keyword_df (pd.DataFrame): DataFrame containing keyword field data.
-        text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
+        keyword_df (pd.DataFrame): DataFrame containing keyword field data (None for an index loaded from a snapshot).
+        keyword_codes (dict): Dictionary of integer code arrays (one code per document) for each keyword field.
+        keyword_values (dict): Dictionary mapping keyword values to their codes for each keyword field.
+        field_offsets (dict): Dictionary of (start, end) column ranges of each text field in the stacked matrix.
+        term_matrix (scipy.sparse.csr_matrix): Stacked normalized TF-IDF matrix, terms x documents.
         docs (list): List of documents indexed.
+        metadata (dict): Optional user data saved with the snapshot.
     """
 
     def __init__(self, text_fields, keyword_fields, vectorizer_params={}):
@@ -30,11 +148,16 @@ class Index:
         """
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
+        self.vectorizer_params = vectorizer_params
 
         self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
         self.keyword_df = None
-        self.text_matrices = {}
+        self.keyword_codes = {}
+        self.keyword_values = {}
+        self.field_offsets = {}
+        self.term_matrix = None
         self.docs = []
+        self.metadata = {}
 
     def fit(self, docs):
         """
@@ -46,18 +169,37 @@ class Index:
         self.docs = docs
         keyword_data = {field: [] for field in self.keyword_fields}
 
+        matrices = []
+        offset = 0
         for field in self.text_fields:
             texts = [doc.get(field, "") for doc in docs]
-            self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+            matrix = normalize(self.vectorizers[field].fit_transform(texts), norm="l2", copy=False)
+            matrices.append(matrix)
+            self.field_offsets[field] = (offset, offset + matrix.shape[1])
+            offset += matrix.shape[1]
+        self.term_matrix = sparse.hstack(matrices, format="csr", dtype=np.float32).T.tocsr()
 
         for doc in docs:
             for field in self.keyword_fields:
                 keyword_data[field].append(doc.get(field, ""))
 
         self.keyword_df = pd.DataFrame(keyword_data)
+        # one integer code per document instead of a boolean mask per value,
+        # so high-cardinality fields like id cost O(docs) memory
+        self.keyword_codes, self.keyword_values = factorize_keywords(docs, self.keyword_fields)
 
         return self
 
+    def _query_vector(self, queries, boost_dict):
+        vectors = []
+        for field in self.text_fields:
+            vector = self.vectorizers[field].transform(queries)
+            boost = boost_dict.get(field, 1)
+            if boost != 1:
+                vector = vector * boost
+            vectors.append(vector)
+        return sparse.hstack(vectors, format="csr", dtype=np.float32)
+
     def search(self, query, filter_dict={}, boost_dict={}, num_results=10, threshold=0.01):
         """
         Searches the index with the given query, filters, and boost parameters.
@@ -67,30 +209,499 @@ class Index:
             filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
             boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
             num_results (int): The number of top results to return. Defaults to 10.
+            threshold (float): Minimum score of returned documents. Defaults to 0.01.
 
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
         """
-        query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
-        scores = np.zeros(len(self.docs))
+        query_vec = self._query_vector([query], boost_dict)
 
-        # Compute cosine similarity for each text field and apply boost
-        for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
-            boost = boost_dict.get(field, 1)
-            scores += sim * boost
+        # sparse row: only documents sharing at least one term with the query
+        scores = (query_vec @ self.term_matrix).tocsr()
+        candidates = scores.indices
+        candidate_scores = scores.data
+
+        # prune before ranking: keyword filters and threshold
+        keep = candidate_scores > threshold
+        for codes, code in filter_codes(self.keyword_codes, self.keyword_values, filter_dict):
+            keep &= codes[candidates] == code
+        candidates = candidates[keep]
+        candidate_scores = candidate_scores[keep]
+
+        if len(candidates) > num_results:
+            top = np.argpartition(candidate_scores, -num_results)[-num_results:]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-candidate_scores[top], kind="stable")]
+
+        return [self.docs[i] for i in candidates[top]]
+
+    def search_many(self, queries, filter_dicts=None, boost_dict={}, num_results=10, threshold=0.01, batch_size=256):
+        """
+        Searches the index with many queries at once: one transform per text field for all queries,
+        one sparse product per batch of queries and row-wise top-k on the dense scores matrix.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dicts (dict or list of dict): Keyword filters, one dict for all queries or one dict per query.
+            boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            threshold (float): Minimum score of returned documents. Defaults to 0.01.
+            batch_size (int): Max number of queries scored at once, limits memory of the dense scores matrix.
+
+        Returns:
+            list of list of dict: For each query, list of documents matching the search criteria, ranked by relevance.
+        """
+        if filter_dicts is None:
+            filter_dicts = {}
+        if isinstance(filter_dicts, dict):
+            filter_dicts = [filter_dicts] * len(queries)
+
+        query_matrix = self._query_vector(queries, boost_dict)
+        num_docs = len(self.docs)
+        num_results = min(num_results, num_docs)
+        batch_size = max(1, min(batch_size, MAX_SCORE_CELLS // max(num_docs, 1)))
+
+        results = []
+        for start in range(0, len(queries), batch_size):
+            scores = (query_matrix[start:start + batch_size] @ self.term_matrix).toarray()
+
+            # queries with the same filters share one mask
+            rows_by_filter = {}
+            for row, filter_dict in enumerate(filter_dicts[start:start + batch_size]):
+                key = tuple(sorted((k, v) for k, v in filter_dict.items() if k in self.keyword_fields))
+                rows_by_filter.setdefault(key, []).append(row)
+            for key, rows in rows_by_filter.items():
+                if not key:
+                    continue
+                mask = np.ones(num_docs, dtype=bool)
+                for codes, code in filter_codes(self.keyword_codes, self.keyword_values, dict(key)):
+                    mask &= codes == code
+                scores[rows] *= mask
+
+            top = np.argpartition(-scores, num_results - 1, axis=1)[:, :num_results]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            for row_top, row_scores in zip(top, top_scores):
+                results.append([self.docs[i] for i, score in zip(row_top, row_scores) if score > threshold])
+
+        return results
+
+    def save(self, path, metadata=None):
+        """
+        Saves the fitted index as a snapshot directory: raw NumPy arrays of the term matrix (CSR data,
+        indices, indptr), IDF weights and keyword codes, JSON vocabularies and JSON lines documents.
+
+        Args:
+            path (str): Snapshot directory, replaced if it exists.
+            metadata (dict): Optional JSON-serializable data to store with the snapshot.
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        save_json(tmp_path, "meta", {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "text_fields": self.text_fields,
+            "keyword_fields": self.keyword_fields,
+            "vectorizer_params": self.vectorizer_params,
+            "field_offsets": self.field_offsets,
+            "shape": self.term_matrix.shape,
+            "metadata": metadata if metadata is not None else self.metadata,
+        })
+        for field in self.text_fields:
+            vocabulary = {term: int(column) for term, column in self.vectorizers[field].vocabulary_.items()}
+            save_json(tmp_path, f"vocabulary_{field}", vocabulary)
+            save_array(tmp_path, f"idf_{field}", self.vectorizers[field].idf_)
+        save_keywords(tmp_path, self.keyword_codes, self.keyword_values)
+        save_array(tmp_path, "term_matrix_data", self.term_matrix.data)
+        save_array(tmp_path, "term_matrix_indices", self.term_matrix.indices)
+        save_array(tmp_path, "term_matrix_indptr", self.term_matrix.indptr)
+        MappedDocs.save(tmp_path, self.docs)
+
+        replace_directory(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads an index saved with save(). With mmap arrays and documents are memory-mapped,
+        so loading is near-instant and processes loading the same snapshot share pages.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap (bool): Memory-map arrays and documents instead of reading them into memory.
+
+        Returns:
+            Index: The loaded index, ready to search.
+        """
+        meta = load_json(path, "meta")
+        if meta["version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported minsearch snapshot version {meta['version']} in {path}")
+
+        index = cls(meta["text_fields"], meta["keyword_fields"], meta["vectorizer_params"])
+        index.metadata = meta["metadata"]
+        index.field_offsets = {field: tuple(offsets) for field, offsets in meta["field_offsets"].items()}
+        for field in index.text_fields:
+            vectorizer = index.vectorizers[field]
+            vectorizer.vocabulary_ = load_json(path, f"vocabulary_{field}")
+            vectorizer.idf_ = load_array(path, f"idf_{field}", mmap=False)
+        index.keyword_codes, index.keyword_values = load_keywords(path, index.keyword_fields, mmap)
+        index.term_matrix = sparse.csr_matrix(
+            (
+                load_array(path, "term_matrix_data", mmap),
+                load_array(path, "term_matrix_indices", mmap),
+                load_array(path, "term_matrix_indptr", mmap),
+            ),
+            shape=tuple(meta["shape"]),
+            copy=False,
+        )
+        index.docs = MappedDocs(path, mmap)
+        return index
+
+
+class VectorIndex:
+    """
+    An exact dense-vector search index: L2-normalized embeddings in one contiguous matrix, cosine
+    similarity as a single matrix-vector product, exact matching for keyword fields (pre-filter).
+
+    Vectors can be stored as float32, float16 or int8 (symmetric per-vector quantization) to cut memory,
+    quantized matrices are scored in chunks to keep temporary float32 copies small.
+
+    Attributes:
+        keyword_fields (list): List of keyword field names to index.
+        dtype (str): Storage type of vectors: "float32", "float16" or "int8".
+        vectors (np.ndarray): Matrix of document vectors, documents x dimensions.
+        scales (np.ndarray): Per-vector dequantization scales for int8 storage, None otherwise.
+        keyword_codes (dict): Dictionary of integer code arrays (one code per document) for each keyword field.
+        keyword_values (dict): Dictionary mapping keyword values to their codes for each keyword field.
+        docs (list): List of documents indexed.
+        metadata (dict): Optional user data saved with the snapshot.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    CHUNK_SIZE = 65536
+
+    def __init__(self, keyword_fields, dtype="float32"):
+        """
+        Initializes the VectorIndex with specified keyword fields and storage type.
+
+        Args:
+            keyword_fields (list): List of keyword field names to index.
+            dtype (str): Storage type of vectors: "float32" (default), "float16" or "int8".
+        """
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}, expected one of {self.DTYPES}")
+        self.keyword_fields = keyword_fields
+        self.dtype = dtype
+        self.vectors = None
+        self.scales = None
+        self.keyword_codes = {}
+        self.keyword_values = {}
+        self.docs = []
+        self.metadata = {}
+
+    def fit(self, vectors, docs):
+        """
+        Fits the index with the provided document vectors.
+
+        Args:
+            vectors (array-like): Matrix of document embeddings, one row per document.
+            docs (list of dict): List of documents to index, in the same order as vectors.
+        """
+        self._store_vectors(normalize(np.asarray(vectors, dtype=np.float32), norm="l2"))
+        self.docs = docs
+        self.keyword_codes, self.keyword_values = factorize_keywords(docs, self.keyword_fields)
+        return self
+
+    def _store_vectors(self, vectors):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self.vectors = np.ascontiguousarray(np.round(vectors / scales[:, None]).astype(np.int8))
+            self.scales = scales.astype(np.float32)
+        else:
+            self.vectors = np.ascontiguousarray(vectors.astype(self.dtype))
+            self.scales = None
+
+    def _scores(self, vector, rows=None):
+        if rows is not None and len(rows) > len(self.vectors) // 4:
+            # scoring all rows is cheaper than copying most of the matrix
+            return self._scores(vector)[rows]
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        if self.dtype == "float32":
+            return vectors @ vector
+
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), self.CHUNK_SIZE):
+            end = start + self.CHUNK_SIZE
+            scores[start:end] = vectors[start:end].astype(np.float32) @ vector
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def _filter_rows(self, filter_dict):
+        filters = filter_codes(self.keyword_codes, self.keyword_values, filter_dict)
+        if not filters:
+            return None
+        mask = np.ones(len(self.docs), dtype=bool)
+        for codes, code in filters:
+            mask &= codes == code
+        return np.flatnonzero(mask)
+
+    def _top(self, scores, rows, num_results, threshold):
+        if len(scores) > num_results:
+            top = np.argpartition(scores, -num_results)[-num_results:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if threshold is not None:
+            top = top[scores[top] > threshold]
+        return [self.docs[i] for i in rows[top]]
+
+    def search(self, vector, filter_dict={}, num_results=10, threshold=None):
+        """
+        Searches the index with the given query vector and filters.
+
+        Args:
+            vector (array-like): The query embedding.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            num_results (int): The number of top results to return. Defaults to 10.
+            threshold (float): Optional minimum cosine similarity of returned documents.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by similarity.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        rows = self._filter_rows(filter_dict)
+        scores = self._scores(vector, rows)
+        if rows is None:
+            rows = np.arange(len(scores))
+
+        return self._top(scores, rows, num_results, threshold)
+
+    def save(self, path, metadata=None):
+        """
+        Saves the fitted index as a snapshot directory of raw NumPy arrays and JSON lines documents.
+
+        Args:
+            path (str): Snapshot directory, replaced if it exists.
+            metadata (dict): Optional JSON-serializable data to store with the snapshot.
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        save_json(tmp_path, "meta", {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "keyword_fields": self.keyword_fields,
+            "dtype": self.dtype,
+            "metadata": metadata if metadata is not None else self.metadata,
+            **self._extra_meta(),
+        })
+        save_array(tmp_path, "vectors", self.vectors)
+        if self.scales is not None:
+            save_array(tmp_path, "scales", self.scales)
+        self._save_extra(tmp_path)
+        save_keywords(tmp_path, self.keyword_codes, self.keyword_values)
+        MappedDocs.save(tmp_path, self.docs)
+
+        replace_directory(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads an index saved with save(), memory-mapped by default.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap (bool): Memory-map arrays and documents instead of reading them into memory.
+
+        Returns:
+            VectorIndex: The loaded index, ready to search.
+        """
+        meta = load_json(path, "meta")
+        if meta["version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported minsearch snapshot version {meta['version']} in {path}")
+
+        index = cls(meta["keyword_fields"], meta["dtype"])
+        index.metadata = meta["metadata"]
+        index.vectors = load_array(path, "vectors", mmap)
+        if index.dtype == "int8":
+            index.scales = load_array(path, "scales", mmap)
+        index._load_extra(path, meta, mmap)
+        index.keyword_codes, index.keyword_values = load_keywords(path, index.keyword_fields, mmap)
+        index.docs = MappedDocs(path, mmap)
+        return index
+
+    def _extra_meta(self):
+        return {}
 
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+    def _save_extra(self, path):
+        pass
 
-        # Use argpartition to get top num_results indices
-        top_indices = np.argpartition(scores, -num_results)[-num_results:]
-        top_indices = top_indices[np.argsort(-scores[top_indices])]
+    def _load_extra(self, path, meta, mmap):
+        pass
 
-        # Filter out zero-score results / lower than threshold
-        top_docs = [self.docs[i] for i in top_indices if scores[i] > threshold]
 
-        return top_docs
+class IVFVectorIndex(VectorIndex):
+    """
+    An approximate dense-vector search index (IVF): vectors are partitioned by a spherical k-means
+    coarse quantizer and stored grouped by partition, a query scans only the nprobe partitions
+    with the closest centroids. Keyword filters are applied within the probed partitions.
+
+    Attributes:
+        n_lists (int): Number of partitions, defaults to sqrt(number of documents).
+        nprobe (int): Default number of partitions scanned per query, higher = better recall, slower.
+        centroids (np.ndarray): Normalized partition centroids, n_lists x dimensions.
+        list_offsets (np.ndarray): Row range of each partition, partition i is rows list_offsets[i]:list_offsets[i + 1].
+    """
+
+    def __init__(self, keyword_fields, dtype="float32", n_lists=None, nprobe=8, kmeans_iterations=20, seed=42):
+        """
+        Initializes the IVFVectorIndex.
+
+        Args:
+            keyword_fields (list): List of keyword field names to index.
+            dtype (str): Storage type of vectors: "float32" (default), "float16" or "int8".
+            n_lists (int): Number of partitions, defaults to sqrt(number of documents).
+            nprobe (int): Default number of partitions scanned per query.
+            kmeans_iterations (int): Number of k-means iterations when fitting centroids.
+            seed (int): Random seed of k-means initialization and training sample.
+        """
+        super().__init__(keyword_fields, dtype)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+
+    def _assign(self, vectors):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), self.CHUNK_SIZE):
+            assignments[start:start + self.CHUNK_SIZE] = np.argmax(vectors[start:start + self.CHUNK_SIZE] @ self.centroids.T, axis=1)
+        return assignments
+
+    def _fit_centroids(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        # k-means on a sample is enough for a coarse quantizer
+        sample_size = min(len(vectors), 256 * self.n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, self.n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignments = self._assign(sample)
+            counts = np.bincount(assignments, minlength=self.n_lists)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, sample)
+            empty = counts == 0
+            # re-seed empty partitions with random sample vectors
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            self.centroids = normalize(sums, norm="l2")
+
+    def fit(self, vectors, docs):
+        """
+        Fits the index: trains centroids and stores vectors and documents grouped by partition.
+
+        Args:
+            vectors (array-like): Matrix of document embeddings, one row per document.
+            docs (list of dict): List of documents to index, in the same order as vectors.
+        """
+        vectors = normalize(np.asarray(vectors, dtype=np.float32), norm="l2")
+        if self.n_lists is None:
+            self.n_lists = max(1, int(np.sqrt(len(vectors))))
+        self.n_lists = min(self.n_lists, len(vectors))
+
+        self._fit_centroids(vectors)
+        assignments = self._assign(vectors)
+        order = np.argsort(assignments, kind="stable")
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))]).astype(np.int64)
+
+        self._store_vectors(vectors[order])
+        self.docs = [docs[i] for i in order]
+        self.keyword_codes, self.keyword_values = factorize_keywords(self.docs, self.keyword_fields)
+        return self
+
+    def _probe_rows(self, lists):
+        return np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+
+    def search(self, vector, filter_dict={}, num_results=10, threshold=None, nprobe=None):
+        """
+        Searches the nprobe closest partitions with the given query vector and filters.
+        If filters leave fewer than num_results candidates, more partitions are probed.
+
+        Args:
+            vector (array-like): The query embedding.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            num_results (int): The number of top results to return. Defaults to 10.
+            threshold (float): Optional minimum cosine similarity of returned documents.
+            nprobe (int): Number of partitions to scan, defaults to the index nprobe.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by similarity.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+
+        list_order = np.argsort(-(self.centroids @ vector))
+        filters = filter_codes(self.keyword_codes, self.keyword_values, filter_dict)
+        probed = 0
+        rows = np.empty(0, dtype=np.int64)
+        while probed < self.n_lists:
+            new_rows = self._probe_rows(list_order[probed:nprobe])
+            for codes, code in filters:
+                new_rows = new_rows[codes[new_rows] == code]
+            rows = np.concatenate([rows, new_rows])
+            probed = nprobe
+            if len(rows) >= num_results:
+                break
+            nprobe = min(nprobe * 2, self.n_lists)
+
+        scores = self._scores(vector, rows)
+        return self._top(scores, rows, num_results, threshold)
+
+    def _extra_meta(self):
+        return {"n_lists": self.n_lists, "nprobe": self.nprobe}
+
+    def _save_extra(self, path):
+        save_array(path, "centroids", self.centroids)
+        save_array(path, "list_offsets", self.list_offsets)
+
+    def _load_extra(self, path, meta, mmap):
+        self.n_lists = meta["n_lists"]
+        self.nprobe = meta["nprobe"]
+        self.centroids = load_array(path, "centroids", mmap=False)
+        self.list_offsets = load_array(path, "list_offsets", mmap=False)
+
+
+def reciprocal_rank_fusion(result_lists, num_results=10, k=60, id_field="id"):
+    """
+    Fuses several ranked result lists (e.g. text and vector search) with reciprocal rank fusion.
+
+    A document scores sum(1 / (k + rank)) over the lists it appears in, so no score normalization
+    between retrievers is needed. Documents are deduplicated by id_field.
+
+    Args:
+        result_lists (list of list of dict): Ranked results of each retriever, best first.
+        num_results (int): The number of top results to return. Defaults to 10.
+        k (int): Rank smoothing constant, larger values flatten the contribution of top ranks. Defaults to 60.
+        id_field (str): Document field identifying the same document across lists. Defaults to "id".
+
+    Returns:
+        list of dict: List of fused documents, best first.
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            doc_id = doc[id_field]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(doc_id, doc)
+    # stable sort keeps the first retriever's order for ties
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[doc_id] for doc_id in ranked[:num_results]]
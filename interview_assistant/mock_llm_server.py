@@ -0,0 +1,180 @@
+"""
+OpenAI-compatible mock LLM server for load tests without Ollama/OpenAI or network:
+/v1/chat/completions (streamed or not, with usage) answers after a configurable first token latency
+and per-token latency, judge prompts get a parsable relevance evaluation.
+
+Usage:
+    python mock_llm_server.py --port 8090 --token-latency 0.02
+    OLLAMA_URL=http://localhost:8090/v1/ OPENAI_BASE_URL=http://localhost:8090/v1/ python loadtest.py ...
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_LLM_PORT = int(os.getenv("MOCK_LLM_PORT", "8090"))
+# seconds before the first token and between tokens, CPU Ollama phi3.5 is ~0.1s per token
+MOCK_FIRST_TOKEN_LATENCY = float(os.getenv("MOCK_FIRST_TOKEN_LATENCY", "0.2"))
+MOCK_TOKEN_LATENCY = float(os.getenv("MOCK_TOKEN_LATENCY", "0.02"))
+# answer length in tokens, capped by the request's max_tokens
+MOCK_COMPLETION_TOKENS = int(os.getenv("MOCK_COMPLETION_TOKENS", "100"))
+# share of requests answered with HTTP 500
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))
+
+WORDS = ("data pipelines model features training batch streaming quality metrics warehouse "
+         "schema latency deployment monitoring experiment").split()
+
+
+def estimate_tokens(text):
+    return max(len(text) // 4, 1)
+
+
+def answer_tokens(prompt, max_tokens, completion_tokens):
+    """Returns the answer as a list of tokens: a relevance evaluation for judge prompts, filler words otherwise."""
+    if '"Relevance"' in prompt:
+        ids = [int(i) for i in re.findall(r"^\s*Id: (\d+)$", prompt, flags=re.MULTILINE)]
+        evaluation = {"Relevance": "RELEVANT", "Explanation": "Mock evaluation."}
+        text = json.dumps([{"Id": i, **evaluation} for i in ids] if ids else evaluation)
+        # about 4 characters per token
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    n = min(completion_tokens, max_tokens) if max_tokens else completion_tokens
+    return [("" if i == 0 else " ") + random.choice(WORDS) for i in range(n)]
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # set by make_server()
+    first_token_latency = MOCK_FIRST_TOKEN_LATENCY
+    token_latency = MOCK_TOKEN_LATENCY
+    completion_tokens = MOCK_COMPLETION_TOKENS
+    error_rate = MOCK_ERROR_RATE
+
+    def log_message(self, format, *args):
+        # one line per request would flood load test output
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, data):
+        # chunked transfer encoding, keeps the connection reusable
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        if random.random() < self.error_rate:
+            self.send_json(500, {"error": {"message": "Mock server error", "type": "server_error"}})
+            return
+
+        prompt = "\n".join(message.get("content") or "" for message in body.get("messages", []))
+        tokens = answer_tokens(prompt, body.get("max_tokens"), self.completion_tokens)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": len(tokens),
+            "total_tokens": estimate_tokens(prompt) + len(tokens),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "mock")
+        time.sleep(self.first_token_latency)
+
+        if not body.get("stream"):
+            time.sleep(self.token_latency * max(len(tokens) - 1, 0))
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self.token_latency)
+                delta = {"content": token, **({"role": "assistant"} if i == 0 else {})}
+                self.send_chunk(b"data: " + json.dumps(
+                    {**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}).encode("utf-8") + b"\n\n")
+            self.send_chunk(b"data: " + json.dumps(
+                {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}).encode("utf-8") + b"\n\n")
+            if body.get("stream_options", {}).get("include_usage"):
+                self.send_chunk(b"data: " + json.dumps({**chunk, "choices": [], "usage": usage}).encode("utf-8") + b"\n\n")
+            self.send_chunk(b"data: [DONE]\n\n")
+            self.send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading (cancelled stream)
+            self.close_connection = True
+
+
+def make_server(host="127.0.0.1", port=MOCK_LLM_PORT, first_token_latency=MOCK_FIRST_TOKEN_LATENCY,
+                token_latency=MOCK_TOKEN_LATENCY, completion_tokens=MOCK_COMPLETION_TOKENS,
+                error_rate=MOCK_ERROR_RATE):
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {
+        "first_token_latency": first_token_latency,
+        "token_latency": token_latency,
+        "completion_tokens": completion_tokens,
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(**kwargs):
+    """Serves in a daemon thread (port 0 picks a free port), returns (server, base URL ending with /v1/)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=MOCK_LLM_PORT)
+    parser.add_argument("--first-token-latency", type=float, default=MOCK_FIRST_TOKEN_LATENCY, help="seconds")
+    parser.add_argument("--token-latency", type=float, default=MOCK_TOKEN_LATENCY, help="seconds per token")
+    parser.add_argument("--completion-tokens", type=int, default=MOCK_COMPLETION_TOKENS)
+    parser.add_argument("--error-rate", type=float, default=MOCK_ERROR_RATE)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.first_token_latency, args.token_latency,
+                         args.completion_tokens, args.error_rate)
+    print(f"Mock LLM server on http://{args.host}:{args.port}/v1/ "
+          f"(first token {args.first_token_latency}s, {args.token_latency}s per token, "
+          f"{args.completion_tokens} tokens, error rate {args.error_rate})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
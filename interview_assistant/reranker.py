@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import numpy as np
+
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# first-stage results scored by the cross-encoder, the best SEARCH_RESULTS_NUM go into the prompt
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+# seconds, first-stage order is kept when scoring takes longer
+RERANK_TIME_BUDGET = float(os.getenv("RERANK_TIME_BUDGET", "0.5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "2"))
+
+
+def document_text(doc):
+    return f"{doc['question']} {doc['text']}"
+
+
+class Reranker:
+    """
+    Re-ranks first-stage search results with a cross-encoder scoring (query, document) pairs on CPU.
+
+    Scoring runs in a small thread pool, a call waits for it at most time_budget seconds and
+    falls back to first-stage order otherwise (the model is loaded in the background on first use,
+    such calls fall back too). Calls arriving while all workers are busy aren't queued, they fall
+    back right away, so a backlog of scoring jobs nobody waits for can't build up.
+
+    Attributes:
+        model_name (str): Name of the cross-encoder model.
+        calls (int): Number of rerank() calls.
+        timeouts (int): Number of calls that exceeded the time budget.
+        skipped (int): Number of calls not scored because all workers were busy.
+        errors (int): Number of calls that failed.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL_NAME, time_budget=RERANK_TIME_BUDGET,
+                 batch_size=RERANK_BATCH_SIZE, workers=RERANK_WORKERS):
+        self.model_name = model_name
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.model = None
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        # pending jobs and the counters below, rerank() is called from concurrent requests
+        self.stats_lock = threading.Lock()
+        self.pending = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def load_model(self):
+        with self.lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name, device="cpu")
+        return self.model
+
+    def score(self, query, docs):
+        model = self.load_model()
+        pairs = [(query, document_text(doc)) for doc in docs]
+        return np.asarray(model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False))
+
+    def rerank(self, query, docs, num_results):
+        """
+        Returns (top num_results docs, seconds spent, whether the cross-encoder order was used).
+        """
+        start_time = time.time()
+        with self.stats_lock:
+            self.calls += 1
+        if len(docs) <= 1:
+            return docs[:num_results], 0.0, False
+
+        with self.stats_lock:
+            if self.pending >= self.workers:
+                self.skipped += 1
+                return docs[:num_results], 0.0, False
+            self.pending += 1
+        future = self.executor.submit(self.score, query, docs)
+        future.add_done_callback(self.job_done)
+        try:
+            scores = future.result(timeout=self.time_budget)
+        except TimeoutError:
+            # a job that hasn't started yet is dropped, a running one still counts as pending until it ends
+            future.cancel()
+            with self.stats_lock:
+                self.timeouts += 1
+            print(f"!! reranking exceeded {self.time_budget}s, keeping first-stage order", flush=True)
+            return docs[:num_results], time.time() - start_time, False
+        except Exception as e:
+            with self.stats_lock:
+                self.errors += 1
+            print(f"!! reranking failed, keeping first-stage order: {e}", flush=True)
+            return docs[:num_results], time.time() - start_time, False
+
+        # stable, ties keep first-stage order
+        order = np.argsort(-scores, kind="stable")[:num_results]
+        return [docs[i] for i in order], time.time() - start_time, True
+
+    def job_done(self, future):
+        with self.stats_lock:
+            self.pending -= 1
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'calls': self.calls,
+                'timeouts': self.timeouts,
+                'skipped': self.skipped,
+                'errors': self.errors,
+            }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    # one model per process
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
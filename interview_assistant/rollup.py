@@ -0,0 +1,132 @@
+"""
+Maintains per-minute rollups of conversations and request_timings read by the Grafana dashboard,
+so panels don't scan the whole conversations table on each refresh.
+
+Each run re-aggregates the minutes of the last ROLLUP_LOOKBACK seconds: conversations are saved
+with relevance PENDING and evaluated later, so recent minutes change after they are first rolled up.
+
+Usage:
+    python rollup.py            # one run
+    python rollup.py --full     # rebuild from all conversations
+    python rollup.py --loop     # every ROLLUP_INTERVAL seconds (rollup container)
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import TIMING_STAGES, get_db_connection, release_db_connection, tz
+
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+# longer than the evaluation queue delay, later relevance updates are missed until a --full run
+ROLLUP_LOOKBACK = float(os.getenv("ROLLUP_LOOKBACK", "900"))
+
+
+def last_rollup_bucket():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(bucket) FROM conversation_rollups")
+            return cur.fetchone()[0]
+    finally:
+        release_db_connection(conn)
+
+
+def refresh_since():
+    # minutes since the last rolled up one catch up after downtime, None (everything) on the first run
+    last_bucket = last_rollup_bucket()
+    if last_bucket is None:
+        return None
+    return min(last_bucket, datetime.now(tz) - timedelta(seconds=ROLLUP_LOOKBACK))
+
+
+def refresh_rollups(since=None):
+    """
+    Replaces rollups of minutes from since on (all minutes when since is None) in one transaction.
+    Returns the number of conversation and timing rollup rows written.
+    """
+    # '-infinity' is a valid timestamp in PostgreSQL, rolls up everything
+    since = since if since is not None else "-infinity"
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM conversation_rollups WHERE bucket >= date_trunc('minute', %s::timestamptz)",
+                        (since,))
+            cur.execute(
+                """
+                INSERT INTO conversation_rollups
+                (bucket, model_used, relevance, conversations, cache_hits, response_time_sum, response_time_max,
+                first_token_time_sum, first_token_count, total_tokens, openai_cost)
+                SELECT
+                    date_trunc('minute', timestamp),
+                    model_used,
+                    relevance,
+                    COUNT(*),
+                    COUNT(*) FILTER (WHERE cache_hit),
+                    SUM(response_time),
+                    MAX(response_time),
+                    COALESCE(SUM(first_token_time), 0),
+                    COUNT(first_token_time),
+                    SUM(total_tokens),
+                    SUM(openai_cost)
+                FROM conversations
+                WHERE timestamp >= date_trunc('minute', %s::timestamptz)
+                GROUP BY 1, 2, 3
+                """,
+                (since,),
+            )
+            conversation_rows = cur.rowcount
+
+            cur.execute("DELETE FROM timing_rollups WHERE bucket >= date_trunc('minute', %s::timestamptz)", (since,))
+            percentiles = ", ".join(
+                f"percentile_cont(0.5) WITHIN GROUP (ORDER BY {stage}_time), "
+                f"percentile_cont(0.95) WITHIN GROUP (ORDER BY {stage}_time)"
+                for stage in TIMING_STAGES
+            )
+            cur.execute(
+                f"""
+                INSERT INTO timing_rollups
+                (bucket, requests, {", ".join(f"{stage}_p50, {stage}_p95" for stage in TIMING_STAGES)})
+                SELECT date_trunc('minute', timestamp), COUNT(*), {percentiles}
+                FROM request_timings
+                WHERE timestamp >= date_trunc('minute', %s::timestamptz)
+                GROUP BY 1
+                """,
+                (since,),
+            )
+            timing_rows = cur.rowcount
+        conn.commit()
+        return conversation_rows, timing_rows
+    finally:
+        release_db_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh per-minute rollups for Grafana")
+    parser.add_argument("--full", action="store_true", help="rebuild from all conversations")
+    parser.add_argument("--loop", action="store_true", help=f"refresh every ROLLUP_INTERVAL ({ROLLUP_INTERVAL}s)")
+    args = parser.parse_args()
+
+    full = args.full
+    while True:
+        start_time = time.time()
+        try:
+            since = None if full else refresh_since()
+            conversation_rows, timing_rows = refresh_rollups(since)
+            print(f"Rolled up since {since or 'the beginning'}: {conversation_rows} conversation, "
+                  f"{timing_rows} timing row(s) in {time.time() - start_time:.2f}s", flush=True)
+            full = False
+        except Exception as e:
+            # tables don't exist until db_prep.py runs, Postgres may be restarting
+            print(f"!! rollup failed: {e}", flush=True)
+        if not args.loop:
+            break
+        time.sleep(max(ROLLUP_INTERVAL - (time.time() - start_time), 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import threading
+
+
+class FlightAbandoned(Exception):
+    pass
+
+
+class Flight:
+    """
+    One in-flight computation: the leader adds streamed chunks and the final result,
+    followers replay the chunks as they arrive and get the same result.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.followers = 0
+        self.condition = threading.Condition()
+
+    def add(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, result):
+        with self.condition:
+            self.result = result
+            self.done = True
+            self.condition.notify_all()
+
+    def fail(self, error):
+        with self.condition:
+            # the leader's reader went away (GeneratorExit), it's not an error of the computation
+            self.error = error if isinstance(error, Exception) else FlightAbandoned("leader stopped")
+            self.done = True
+            self.condition.notify_all()
+
+    def follow(self):
+        # yields all chunks, from the first one, then returns the result or raises the leader's error
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                new_chunks = self.chunks[position:]
+                done = self.done
+            position += len(new_chunks)
+            yield from new_chunks
+            if done and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return self.result
+
+
+class SingleFlight:
+    """
+    Registry of in-flight computations by key: the first caller of join() for a key leads,
+    callers joining while it runs follow it, the leader calls leave() when done.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """Returns (flight, True) for the leader, (flight, False) for followers."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.leaders += 1
+                return flight, True
+            flight.followers += 1
+            self.followers += 1
+            return flight, False
+
+    def leave(self, key, flight):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'in_flight': len(self.flights),
+            }
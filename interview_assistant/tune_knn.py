@@ -0,0 +1,125 @@
+"""
+kNN tuning: recall and latency of Elasticsearch kNN search over ground-truth questions for a range of
+k and num_candidates values. Exact (brute-force script_score) results are the recall reference,
+the smallest num_candidates reaching the target recall is recommended.
+
+Usage:
+    python tune_knn.py
+    python tune_knn.py --k 3 5 --num-candidates 10 20 50 100 200 500 --target-recall 0.99
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ingest import INDEX_NAME, encode_texts, setup_elasticsearch
+from evaluate_retrieval import GROUND_TRUTH_PATH, hit_rate, load_ground_truth, mrr
+
+VECTOR_FIELD = "question_text_vector"
+
+
+def knn_search(es_client, vector, position, k, num_candidates, index_name=INDEX_NAME):
+    search_query = {
+        "knn": {
+            "field": VECTOR_FIELD,
+            "query_vector": vector,
+            "k": k,
+            "num_candidates": num_candidates,
+            "filter": {"term": {"position": position}},
+        },
+        "size": k,
+        "_source": ["id"],
+    }
+    start_time = time.perf_counter()
+    response = es_client.search(index=index_name, body=search_query)
+    elapsed = time.perf_counter() - start_time
+    return [hit["_source"]["id"] for hit in response["hits"]["hits"]], elapsed, response["took"]
+
+
+def exact_search(es_client, vector, position, k, index_name=INDEX_NAME):
+    # scores every filtered document, slow but with perfect recall
+    search_query = {
+        "size": k,
+        "_source": ["id"],
+        "query": {
+            "script_score": {
+                "query": {"bool": {"filter": {"term": {"position": position}}}},
+                "script": {
+                    "source": f"cosineSimilarity(params.query_vector, '{VECTOR_FIELD}') + 1.0",
+                    "params": {"query_vector": vector},
+                },
+            }
+        },
+    }
+    response = es_client.search(index=index_name, body=search_query)
+    return [hit["_source"]["id"] for hit in response["hits"]["hits"]]
+
+
+def sweep(es_client, ground_truth, vectors, k, num_candidates_list, index_name=INDEX_NAME):
+    exact = [exact_search(es_client, vector, q["position"], k, index_name) for q, vector in zip(ground_truth, vectors)]
+    rows = []
+    for num_candidates in num_candidates_list:
+        if num_candidates < k:
+            continue
+        results, times, took = [], [], []
+        for q, vector in zip(ground_truth, vectors):
+            ids, elapsed, took_ms = knn_search(es_client, vector, q["position"], k, num_candidates, index_name)
+            results.append(ids)
+            times.append(elapsed * 1000)
+            took.append(took_ms)
+        relevance_total = [[doc_id == q["document"] for doc_id in ids] for q, ids in zip(ground_truth, results)]
+        rows.append({
+            "k": k,
+            "num_candidates": num_candidates,
+            "recall": np.mean([len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(results, exact)]),
+            "hit_rate": hit_rate(relevance_total),
+            "mrr": mrr(relevance_total),
+            "p50_ms": np.percentile(times, 50),
+            "p95_ms": np.percentile(times, 95),
+            "took_p50_ms": np.percentile(took, 50),
+        })
+    return rows
+
+
+def recommend(rows, target_recall):
+    # cheapest setting within the target, otherwise the most accurate one
+    good = [row for row in rows if row["recall"] >= target_recall]
+    if good:
+        return min(good, key=lambda row: row["num_candidates"])
+    return max(rows, key=lambda row: row["recall"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep Elasticsearch kNN num_candidates: recall vs latency")
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--index-name", default=INDEX_NAME)
+    parser.add_argument("--k", type=int, nargs="+", default=[3])
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[3, 10, 20, 50, 100, 200, 500, 1000, 10000])
+    parser.add_argument("--target-recall", type=float, default=0.99)
+    parser.add_argument("--queries", type=int, default=0, help="limit the number of ground-truth questions (0 - all)")
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth(args.ground_truth)
+    if args.queries:
+        ground_truth = ground_truth[:args.queries]
+    es_client = setup_elasticsearch()
+    vectors = [vector.tolist() for vector in encode_texts([q["question"] for q in ground_truth])]
+
+    # warm up caches and the HNSW graph before measuring
+    for q, vector in zip(ground_truth[:50], vectors):
+        knn_search(es_client, vector, q["position"], max(args.k), max(args.num_candidates), args.index_name)
+
+    print(f"\nkNN sweep over {len(ground_truth)} question(s), recall against exact search")
+    print(f"{'k':>3} {'num_candidates':>15} {'recall':>7} {'hit_rate':>9} {'mrr':>6} {'p50 ms':>8} {'p95 ms':>8} {'took p50':>9}")
+    for k in args.k:
+        rows = sweep(es_client, ground_truth, vectors, k, args.num_candidates, args.index_name)
+        for row in rows:
+            print(f"{row['k']:>3} {row['num_candidates']:>15} {row['recall']:>7.3f} {row['hit_rate']:>9.3f} "
+                  f"{row['mrr']:>6.3f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['took_p50_ms']:>9.1f}")
+        best = recommend(rows, args.target_recall)
+        print(f" k={k}: recommended KNN_NUM_CANDIDATES={best['num_candidates']} "
+              f"(recall {best['recall']:.3f}, p50 {best['p50_ms']:.2f} ms)\n")
+
+
+if __name__ == "__main__":
+    main()